@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Benchmark nanocode grep against the legacy glob-based scan on a synthetic tree."""
+
+import argparse, glob as globlib, json, os, re, shutil, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from synthetic import MIXED_LAYOUT, NEEDLE, make_tree
+
+
+def legacy_grep(args):
+    pattern = re.compile(args["pat"])
+    hits = []
+    for filepath in globlib.glob(args.get("path", ".") + "/**", recursive=True):
+        try:
+            for line_num, line in enumerate(open(filepath, encoding="utf-8", errors="replace"), 1):
+                if pattern.search(line):
+                    hits.append(f"{filepath}:{line_num}:{line.rstrip()}")
+        except Exception:
+            pass
+    return "\n".join(hits[:50]) or "none"
+
+
+def timed(fn, args, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result.count("\n") + 1 if result != "none" else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--root", help="reuse or keep the synthetic tree at this path")
+    parser.add_argument("--skip-legacy", action="store_true")
+    options = parser.parse_args()
+
+    root = options.root or tempfile.mkdtemp(prefix="nanocode-bench-")
+    try:
+        if not os.listdir(root):
+            start = time.perf_counter()
+            make_tree(root, options.files, layout=MIXED_LAYOUT)
+            print(f"generated {options.files} files in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        cases = {
+            "rare": {"pat": NEEDLE, "path": root},
+            "common": {"pat": r"return x \+ 3\b", "path": root},
+            "filtered": {"pat": NEEDLE, "path": root, "include": "*.py"},
+        }
+        results = []
+        for name, args in cases.items():
+            impls = [("grep", nanocode.grep)]
+            if not options.skip_legacy and "include" not in args:
+                impls.append(("legacy", legacy_grep))
+            for impl, fn in impls:
+                seconds, lines = timed(fn, args, options.repeat)
+                results.append({"case": name, "impl": impl, "seconds": round(seconds, 4), "lines": lines})
+        print(json.dumps({"files": options.files, "results": results}, indent=2))
+    finally:
+        if not options.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Time nanocode tools over synthetic workspaces and compare against a stored baseline."""
+
+import argparse, json, multiprocessing, os, platform, shutil, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from synthetic import make_binary, make_deep, make_huge_file, make_tree
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE = Path(__file__).with_name("baseline.json")
+MIN_GATE_REPEAT = 3
+
+
+WORKSPACES = {
+    "1k": lambda root: make_tree(root, 1_000),
+    "100k": lambda root: make_tree(root, 100_000),
+    "1m": lambda root: make_tree(root, 1_000_000),
+    "deep": make_deep,
+    "huge_file": make_huge_file,
+    "binary": make_binary,
+}
+DEFAULT_WORKSPACES = ["1k", "deep", "huge_file", "binary"]
+
+
+def first_file(root):
+    return next(nanocode.walk_files(root, include="*.py"))
+
+
+def cases(root):
+    """(tool, case, args, setup) tuples; setup runs before each timed call, outside the timer."""
+    target = first_file(root)
+    scratch = os.path.join(root, "scratch", "edit_target.py")
+
+    def reset_scratch():
+        with open(scratch, "w") as f:
+            f.write("value = 1\n" * 1000 + "UNIQUE_LINE = 0\n")
+
+    return [
+        ("read", "head", {"path": target, "limit": 200}, None),
+        ("read", "tail_offset", {"path": target, "offset": 10_000_000, "limit": 50}, None),
+        ("glob", "all_py", {"pat": "**/*.py", "path": root}, None),
+        ("grep", "rare", {"pat": "NEEDLE_MARKER", "path": root}, None),
+        ("grep", "common", {"pat": r"return x \+ 1\b", "path": root}, None),
+        ("grep", "context_filtered", {"pat": "NEEDLE_MARKER", "path": root, "include": "*.py", "context": 2}, None),
+        ("edit", "unique", {"path": scratch, "old": "UNIQUE_LINE = 0", "new": "UNIQUE_LINE = 1"}, reset_scratch),
+        ("edit", "replace_all", {"path": scratch, "old": "value = 1", "new": "value = 2", "all": True}, reset_scratch),
+        ("bash", "echo", {"cmd": "echo ok"}, None),
+        ("bash", "noisy", {"cmd": f'"{sys.executable}" -c "for i in range(200000): print(i)"'}, None),
+    ]
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_case(conn, tool, args, setup, repeat):
+    """Runs in a fresh child so peak RSS reflects this case alone."""
+    nanocode.RENDER_OUTPUT = False
+    nanocode.FILE_CACHE = nanocode.FileCache(0)
+    before = peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        nanocode.TOOLS[tool][2](args)
+        timings.append(time.perf_counter() - started)
+    conn.send({"timings": timings, "rss_before_kb": before, "peak_rss_kb": peak_rss_kb()})
+    conn.close()
+
+
+def measure(tool, args, setup, repeat):
+    ctx = multiprocessing.get_context("fork")
+    parent, child = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=run_case, args=(child, tool, args, setup, repeat))
+    process.start()
+    child.close()
+    result = parent.recv()
+    process.join()
+    timings = sorted(result["timings"])
+    return {
+        "best_s": round(timings[0], 6),
+        "median_s": round(timings[len(timings) // 2], 6),
+        "peak_rss_kb": result["peak_rss_kb"],
+        "rss_growth_kb": result["peak_rss_kb"] - result["rss_before_kb"] if resource else None,
+    }
+
+
+def prepare(base, name):
+    root = os.path.join(base, name)
+    ready = os.path.join(root, ".bench-ready")
+    if not os.path.exists(ready):
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        started = time.perf_counter()
+        WORKSPACES[name](root)
+        open(ready, "w").close()
+        print(f"generated {name} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return root
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """Returns report lines and whether any case's best time got slower than baseline by more than
+    tolerance and by at least min_delta seconds (sub-millisecond cases are too noisy for a ratio alone)."""
+    previous = {(r["workspace"], r["tool"], r["case"]): r for r in baseline.get("results", [])}
+    lines, regressed = [], False
+    for result in results:
+        old = previous.get((result["workspace"], result["tool"], result["case"]))
+        if not old:
+            continue
+        ratio = result["best_s"] / old["best_s"] if old["best_s"] else 1.0
+        flag = ""
+        if ratio > 1 + tolerance and result["best_s"] - old["best_s"] >= min_delta:
+            flag, regressed = "  REGRESSION", True
+        lines.append(
+            f"{result['workspace']:>9} {result['tool']:>5} {result['case']:<16} "
+            f"{old['best_s']:.4f}s -> {result['best_s']:.4f}s ({ratio:.2f}x){flag}"
+        )
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workspaces", default=",".join(DEFAULT_WORKSPACES), help=f"comma list of {', '.join(WORKSPACES)}")
+    parser.add_argument("--tools", help="comma list of tools to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--root", help="keep generated workspaces here and reuse them across runs")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", default=str(BASELINE), help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with these results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="ignore slowdowns smaller than this many seconds")
+    options = parser.parse_args()
+
+    tools = set(options.tools.split(",")) if options.tools else None
+    base = options.root or tempfile.mkdtemp(prefix="nanocode-bench-")
+    results = []
+    try:
+        for name in options.workspaces.split(","):
+            root = prepare(base, name)
+            for tool, case, args, setup in cases(root):
+                if tools and tool not in tools:
+                    continue
+                results.append({"workspace": name, "tool": tool, "case": case, **measure(tool, args, setup, options.repeat)})
+                print(f"{name:>9} {tool:>5} {case:<16} {results[-1]['median_s']:.4f}s", file=sys.stderr)
+    finally:
+        if not options.root:
+            shutil.rmtree(base, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": options.repeat,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if options.output:
+        Path(options.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    regressed = False
+    if options.save_baseline:
+        Path(options.baseline).write_text(text + "\n")
+    elif os.path.exists(options.baseline):
+        lines, regressed = compare(
+            results, json.loads(Path(options.baseline).read_text()), options.tolerance, options.min_delta
+        )
+        print("\n".join(["", f"compared with {options.baseline}:", *lines]), file=sys.stderr)
+        if regressed and options.repeat < MIN_GATE_REPEAT:
+            print(f"not failing: --repeat below {MIN_GATE_REPEAT} is too noisy to gate on", file=sys.stderr)
+            regressed = False
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Synthetic workspaces shared by the benchmark scripts."""
+
+import os, random
+
+WORDS = ["alpha", "beta", "gamma", "delta", "value", "result", "config", "handler", "parse", "render"]
+NEEDLE = "NEEDLE_MARKER"
+# (top-level directory, share of files); build/ is .gitignore'd, .git and node_modules are skipped dirs
+SOURCE_LAYOUT = [("src", 0.95), ("build", 0.05)]
+MIXED_LAYOUT = [("src", 0.6), ("node_modules", 0.2), (".git/objects", 0.1), ("build", 0.05), ("assets", 0.05)]
+
+
+def source_text(rng, lines):
+    body = []
+    for n in range(lines // 2):
+        body.append(f"def {rng.choice(WORDS)}_{rng.choice(WORDS)}_{n}(x):\n    return x + {n}\n")
+    if rng.random() < 0.01:
+        body.insert(rng.randrange(len(body) + 1), f"{NEEDLE} = True\n")
+    return "".join(body)
+
+
+def binary_blob(rng, size):
+    return rng.randbytes(size) + f"\0{NEEDLE}".encode()
+
+
+def make_tree(root, files, seed=0, layout=SOURCE_LAYOUT):
+    """files files, ~100 per directory, split across top-level directories by layout;
+    files under assets/ are binary, everything else is Python source."""
+    rng = random.Random(seed)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("build/\n*.log\n")
+    for top, share in layout:
+        for idx in range(int(files * share)):
+            directory = os.path.join(root, top, f"pkg{idx // 10000}", f"mod{idx // 100 % 100}")
+            os.makedirs(directory, exist_ok=True)
+            if top == "assets":
+                with open(os.path.join(directory, f"blob{idx}.bin"), "wb") as f:
+                    f.write(binary_blob(rng, 512))
+                continue
+            with open(os.path.join(directory, f"file{idx}.py"), "w") as f:
+                f.write(source_text(rng, 20))
+    os.makedirs(os.path.join(root, "scratch"), exist_ok=True)
+
+
+def make_deep(root, depth=200, width=3, seed=0):
+    """A chain of nested directories with a few files at every level."""
+    rng = random.Random(seed)
+    directory = root
+    for level in range(depth):
+        directory = os.path.join(directory, f"level{level}")
+        os.makedirs(directory)
+        for idx in range(width):
+            with open(os.path.join(directory, f"file{idx}.py"), "w") as f:
+                f.write(source_text(rng, 20))
+    os.makedirs(os.path.join(root, "scratch"), exist_ok=True)
+
+
+def make_huge_file(root, megabytes=100, seed=0):
+    """One large text file plus a couple of small neighbours."""
+    rng = random.Random(seed)
+    chunk = source_text(rng, 20_000)
+    with open(os.path.join(root, "huge.py"), "w") as f:
+        for _ in range(max(1, megabytes * 1024 * 1024 // len(chunk))):
+            f.write(chunk)
+        f.write(f"{NEEDLE} = True\n")
+    for idx in range(3):
+        with open(os.path.join(root, f"small{idx}.py"), "w") as f:
+            f.write(source_text(rng, 20))
+    os.makedirs(os.path.join(root, "scratch"), exist_ok=True)
+
+
+def make_binary(root, files=2000, seed=0):
+    """Mostly binary blobs (images, archives) with a handful of text files mixed in."""
+    rng = random.Random(seed)
+    for idx in range(files):
+        directory = os.path.join(root, "assets", f"d{idx // 100}")
+        os.makedirs(directory, exist_ok=True)
+        if idx % 50 == 0:
+            with open(os.path.join(directory, f"notes{idx}.py"), "w") as f:
+                f.write(source_text(rng, 20))
+            continue
+        with open(os.path.join(directory, f"blob{idx}.bin"), "wb") as f:
+            f.write(binary_blob(rng, 16 * 1024))
+    os.makedirs(os.path.join(root, "scratch"), exist_ok=True)
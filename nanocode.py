@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 """nanocode - minimal claude code alternative"""
 
-import glob as globlib, json, os, re, subprocess, sys, urllib.request
+import atexit, codecs, collections, fnmatch, glob as globlib, hashlib, http.client, http.server
+import io, itertools, json, math, multiprocessing, os, queue, re, shutil, signal, socket, socketserver, sqlite3
+import secrets, subprocess, sys, tempfile, threading, time, urllib.error, urllib.parse, urllib.request, uuid
+from concurrent.futures import ThreadPoolExecutor
 
 VALID_PROVIDERS = {"vsellm", "ollama", "vllm", "openrouter", "anthropic"}
-PROVIDER = None
-API_URL = None
-MODEL = None
 
 
 def normalize_vsellm_url(url):
@@ -172,6 +172,12 @@ def resolve_provider():
         "(set NANOCODE_ALLOW_IMPLICIT_PROVIDER=1 to use deprecated implicit selection)"
     )
 
+
+def resolve_fast_provider():
+    provider = os.environ.get("NANOCODE_FAST_PROVIDER", "").strip()
+    return select_provider(provider) if provider else None
+
+
 # ANSI colors
 RESET, BOLD, DIM = "\033[0m", "\033[1m", "\033[2m"
 BLUE, CYAN, GREEN, YELLOW, RED = (
@@ -183,18 +189,117 @@ BLUE, CYAN, GREEN, YELLOW, RED = (
 )
 
 
+# --- Turn cancellation ---
+
+
+class TurnCancelled(Exception):
+    pass
+
+
+class Turn:
+    """Cancellation scope for one user request; blocking calls register abort hooks on it.
+    owner scopes the background jobs started during the turn to its session."""
+
+    def __init__(self, owner=None):
+        self.cancelled = threading.Event()
+        self.aborts = set()
+        self.owner = owner
+
+    def cancel(self):
+        self.cancelled.set()
+        for abort in list(self.aborts):
+            abort()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise TurnCancelled()
+
+
+TURN = threading.local()
+
+
+def current_turn():
+    return getattr(TURN, "turn", None)
+
+
 # --- Tool implementations ---
 
 
+class FileCache:
+    """Decoded file lines keyed by (path, mtime, size), LRU-bounded by total bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def lines(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return entry[1]
+        lines = open(path, encoding="utf-8", errors="replace").readlines()
+        if stat.st_size > self.max_bytes // 4:
+            return lines
+        with self.lock:
+            self._drop(key)
+            self.entries[key] = (stamp, lines)
+            self.size += stat.st_size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+        return lines
+
+    def discard(self, path):
+        with self.lock:
+            self._drop(os.path.abspath(path))
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.size -= entry[0][1]
+
+
+FILE_CACHE = FileCache(64 * 1024 * 1024)
+
+
 def read(args):
-    lines = open(args["path"], encoding="utf-8", errors="replace").readlines()
+    lines = FILE_CACHE.lines(args["path"])
     offset = args.get("offset", 0)
     limit = args.get("limit", len(lines))
     selected = lines[offset : offset + limit]
     return "".join(f"{offset + idx + 1:4}| {line}" for idx, line in enumerate(selected))
 
 
+READ_MANY_BUDGET = 30_000
+
+
+def read_many(args):
+    specs = [{"path": spec} if isinstance(spec, str) else spec for spec in args["files"]]
+    if not specs:
+        return "none"
+    budget = args.get("budget", READ_MANY_BUDGET)
+    with ThreadPoolExecutor(max_workers=min(8, len(specs))) as pool:
+        results = list(pool.map(lambda spec: run_tool("read", spec), specs))
+    sections = []
+    for spec, result in zip(specs, results):
+        header = f"==> {spec.get('path')} <=="
+        if budget <= 0:
+            sections.append(f"{header}\n(skipped: output budget exhausted)")
+            continue
+        if len(result) > budget:
+            result = result[:budget] + "\n(truncated: output budget exhausted)"
+        budget -= len(result)
+        sections.append(f"{header}\n{result}")
+    return "\n\n".join(sections)
+
+
 def write(args):
+    FILE_CACHE.discard(args["path"])
     with open(args["path"], "w", encoding="utf-8", errors="replace") as f:
         f.write(args["content"])
     return "ok"
@@ -211,6 +316,7 @@ def edit(args):
     replacement = (
         text.replace(old, new) if args.get("all") else text.replace(old, new, 1)
     )
+    FILE_CACHE.discard(args["path"])
     with open(args["path"], "w", encoding="utf-8", errors="replace") as f:
         f.write(replacement)
     return "ok"
@@ -227,39 +333,692 @@ def glob(args):
     return "\n".join(files) or "none"
 
 
+GREP_MAX_HITS = 50
+GREP_WORKERS = 8
+GREP_BATCH = 32
+BINARY_SNIFF = 8192
+GREP_WHOLE_FILE_BYTES = 1024 * 1024
+SKIP_DIRS = {".git", ".hg", ".svn", "node_modules"}
+
+
+def _gitignore_regex(pattern, anchored):
+    parts = []
+    idx = 0
+    while idx < len(pattern):
+        if pattern.startswith("**/", idx):
+            parts.append("(?:.*/)?")
+            idx += 3
+        elif pattern.startswith("**", idx):
+            parts.append(".*")
+            idx += 2
+        elif pattern[idx] == "*":
+            parts.append("[^/]*")
+            idx += 1
+        elif pattern[idx] == "?":
+            parts.append("[^/]")
+            idx += 1
+        elif pattern[idx] == "[" and "]" in pattern[idx + 2 :]:
+            end = pattern.index("]", idx + 2)
+            body = pattern[idx + 1 : end]
+            parts.append("[" + ("^" + body[1:] if body[0] == "!" else body) + "]")
+            idx = end + 1
+        else:
+            parts.append(re.escape(pattern[idx]))
+            idx += 1
+    return re.compile(("" if anchored else "(?:.*/)?") + "".join(parts) + r"\Z")
+
+
+def gitignore_rules(dirpath):
+    try:
+        lines = open(os.path.join(dirpath, ".gitignore"), encoding="utf-8", errors="replace").read().splitlines()
+    except OSError:
+        return []
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate or line.startswith("\\"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if line:
+            rules.append((dirpath, _gitignore_regex(line, anchored), negate, dir_only))
+    return rules
+
+
+def is_ignored(rules, path, is_dir):
+    ignored = False
+    for base, regex, negate, dir_only in rules:
+        if dir_only and not is_dir:
+            continue
+        if regex.match(path[len(base) :].lstrip("/\\").replace(os.sep, "/")):
+            ignored = not negate
+    return ignored
+
+
+def _globs(value):
+    return [pat.strip() for pat in (value or "").split(",") if pat.strip()]
+
+
+def walk_files(root, include=None, exclude=None):
+    include, exclude = _globs(include), _globs(exclude)
+    stack = [(root, gitignore_rules(root))]
+    while stack:
+        dirpath, rules = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name not in SKIP_DIRS and not is_ignored(rules, entry.path, True):
+                    subdirs.append(entry.path)
+                continue
+            if not is_file or is_ignored(rules, entry.path, False):
+                continue
+            rel = entry.path[len(root) :].lstrip("/\\").replace(os.sep, "/")
+            if include and not any(fnmatch.fnmatch(rel, pat) or fnmatch.fnmatch(entry.name, pat) for pat in include):
+                continue
+            if any(fnmatch.fnmatch(rel, pat) or fnmatch.fnmatch(entry.name, pat) for pat in exclude):
+                continue
+            yield entry.path
+        for subdir in reversed(subdirs):
+            stack.append((subdir, rules + gitignore_rules(subdir)))
+
+
+def _scan_lines(path, lines, pattern, context, max_hits):
+    entries, before = [], collections.deque(maxlen=context)
+    matches = after = last = 0
+    for number, line in enumerate(lines, 1):
+        if matches < max_hits and pattern.search(line):
+            if context and entries and number - len(before) > last + 1:
+                entries.append((None, "--"))
+            entries.extend((False, f"{path}-{ctx}-{text}") for ctx, text in before)
+            before.clear()
+            entries.append((True, f"{path}:{number}:{line.rstrip()}"))
+            last, after = number, context
+            matches += 1
+        elif after:
+            entries.append((False, f"{path}-{number}-{line.rstrip()}"))
+            last, after = number, after - 1
+        elif matches >= max_hits:
+            break
+        elif context:
+            before.append((number, line.rstrip()))
+    return entries
+
+
+def _scan_file(path, pattern, prefilter, context, max_hits):
+    # lines are split like read() splits them (universal newlines), so line numbers agree
+    try:
+        with open(path, "rb") as f:
+            data = f.read(GREP_WHOLE_FILE_BYTES)
+            if b"\0" in data[:BINARY_SNIFF]:
+                return []
+            if len(data) < GREP_WHOLE_FILE_BYTES:
+                text = data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+                if prefilter and not prefilter.search(text):
+                    return []
+                return _scan_lines(path, io.StringIO(text), pattern, context, max_hits)
+            # large files are streamed so each worker holds only a buffer and a few lines
+            f.seek(0)
+            return _scan_lines(path, io.TextIOWrapper(f, encoding="utf-8", errors="replace"), pattern, context, max_hits)
+    except OSError:
+        return []
+
+
+def _scan_batch(paths, pattern, prefilter, context, max_hits, stop):
+    results = []
+    for path in paths:
+        if stop.is_set():
+            break
+        results.append(_scan_file(path, pattern, prefilter, context, max_hits))
+    return results
+
+
 def grep(args):
     pattern = re.compile(args["pat"])
-    hits = []
-    for filepath in globlib.glob(args.get("path", ".") + "/**", recursive=True):
+    # a whole-file search can't see per-line \A or negative lookbehind matches at line starts
+    prefilter = None if re.search(r"\\A|\(\?<!", args["pat"]) else re.compile(args["pat"], re.MULTILINE)
+    root = args.get("path", ".")
+    context = max(args.get("context", 0), 0)
+    if os.path.isfile(root):
+        files = iter([root])
+    else:
+        files = walk_files(root, args.get("include"), args.get("exclude"))
+    batches = iter(lambda: list(itertools.islice(files, GREP_BATCH)), [])
+    stop = threading.Event()
+    output, matches = [], 0
+    with ThreadPoolExecutor(max_workers=GREP_WORKERS) as pool:
+        pending = collections.deque(
+            pool.submit(_scan_batch, batch, pattern, prefilter, context, GREP_MAX_HITS, stop)
+            for batch in itertools.islice(batches, GREP_WORKERS * 2)
+        )
+        while pending and matches < GREP_MAX_HITS:
+            for entries in pending.popleft().result():
+                if not entries or matches >= GREP_MAX_HITS:
+                    continue
+                if context and output:
+                    output.append("--")
+                for is_match, line in entries:
+                    if is_match is not False and matches >= GREP_MAX_HITS:
+                        break
+                    output.append(line)
+                    matches += bool(is_match)
+            batch = next(batches, None)
+            if batch:
+                pending.append(pool.submit(_scan_batch, batch, pattern, prefilter, context, GREP_MAX_HITS, stop))
+        stop.set()
+        for future in pending:
+            future.cancel()
+    return "\n".join(output) or "none"
+
+
+INDEX_VERSION = 2
+INDEX_CHUNK_LINES = 40
+INDEX_MAX_BYTES = 1_000_000
+INDEX_RESCAN_SECONDS = 10
+BM25_K1, BM25_B = 1.2, 0.75
+INDEXES = {}
+
+
+def tokenize(text):
+    tokens = []
+    for word in re.findall(r"[A-Za-z0-9_]+", text):
+        parts = [
+            part.lower()
+            for piece in word.split("_")
+            for part in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", piece)
+        ]
+        if len(word) > 1:
+            tokens.append(word.lower())
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if len(part) > 1)
+    return tokens
+
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "nanocode")
+
+
+def index_cache_dir():
+    return os.path.join(cache_dir(), "index")
+
+
+class CodeIndex:
+    """BM25 over fixed-size line chunks. Postings are kept per file, so an update only re-reads and
+    re-posts files whose stamp changed, and only those files are appended to the on-disk journal."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        digest = hashlib.sha1(self.root.encode()).hexdigest()[:16]
+        self.path = os.path.join(index_cache_dir(), f"{digest}.jsonl")
+        self.files = {}
+        self.postings = {}
+        self.chunk_count = self.chunk_length = 0
+        self.records = None  # journal lines on disk; None until a journal for this root was loaded
+        self.scanned = None  # monotonic time of the last full walk
+        self.dirty = set()
+        self.lock = threading.Lock()
         try:
-            for line_num, line in enumerate(open(filepath, encoding="utf-8", errors="replace"), 1):
-                if pattern.search(line):
-                    hits.append(f"{filepath}:{line_num}:{line.rstrip()}")
-        except Exception:
+            with open(self.path, encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                if header.get("version") == INDEX_VERSION and header.get("root") == self.root:
+                    self.records = 0
+                    for line in f:
+                        try:
+                            rel, entry = json.loads(line)
+                        except (ValueError, TypeError):
+                            continue  # torn append; the file's stamp won't match and it is re-read
+                        self.records += 1
+                        self.set_entry(rel, entry)
+        except (OSError, ValueError):
             pass
-    return "\n".join(hits[:50]) or "none"
 
-
-def bash(args):
-    proc = subprocess.Popen(
-        args["cmd"], shell=True,
+    def chunks(self, path, rel):
+        with open(path, "rb") as f:
+            data = f.read(INDEX_MAX_BYTES + 1)
+        if len(data) > INDEX_MAX_BYTES or b"\0" in data[:BINARY_SNIFF]:
+            return []
+        lines = data.decode("utf-8", errors="replace").splitlines()
+        path_terms = collections.Counter(tokenize(rel))
+        chunks = []
+        for start in range(0, len(lines), INDEX_CHUNK_LINES):
+            counts = path_terms + collections.Counter(tokenize("\n".join(lines[start : start + INDEX_CHUNK_LINES])))
+            end = min(start + INDEX_CHUNK_LINES, len(lines))
+            chunks.append([start, end, sum(counts.values()), dict(counts)])
+        return chunks
+
+    def set_entry(self, rel, entry):
+        old = self.files.pop(rel, None)
+        if old:
+            for term in {term for chunk in old["chunks"] for term in chunk[3]}:
+                postings = self.postings[term]
+                del postings[rel]
+                if not postings:
+                    del self.postings[term]
+            self.chunk_count -= len(old["chunks"])
+            self.chunk_length -= sum(chunk[2] for chunk in old["chunks"])
+        if entry:
+            self.files[rel] = entry
+            for idx, (_start, _end, _length, counts) in enumerate(entry["chunks"]):
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {}).setdefault(rel, []).append((idx, tf))
+            self.chunk_count += len(entry["chunks"])
+            self.chunk_length += sum(chunk[2] for chunk in entry["chunks"])
+
+    def refresh(self, rel, changed):
+        try:
+            stat = os.stat(os.path.join(self.root, rel))
+            stamp = [stat.st_mtime_ns, stat.st_size]
+            if self.files.get(rel, {}).get("stamp") != stamp:
+                changed[rel] = {"stamp": stamp, "chunks": self.chunks(os.path.join(self.root, rel), rel)}
+        except OSError:
+            if rel in self.files:
+                changed[rel] = None
+
+    def update(self):
+        changed = {}
+        if self.scanned is None or time.monotonic() - self.scanned > INDEX_RESCAN_SECONDS:
+            seen, turn = set(), current_turn()
+            for path in walk_files(self.root):
+                if turn:
+                    turn.check()  # a first build of a big tree runs in-process and must stay cancellable
+                rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+                seen.add(rel)
+                self.refresh(rel, changed)
+            changed.update((rel, None) for rel in set(self.files) - seen)
+            self.scanned = time.monotonic()
+        else:
+            for rel in self.dirty:
+                self.refresh(rel, changed)
+        self.dirty.clear()
+        for rel, entry in changed.items():
+            self.set_entry(rel, entry)
+        if changed:
+            self.save(changed)
+
+    def invalidate(self, path=None):
+        """A file we already index is re-read on the next search; anything else (a new file, or
+        a command that may have touched anything) forces a full walk."""
+        with self.lock:
+            if path is None:
+                self.scanned = None
+                return
+            path = os.path.abspath(path)
+            if os.path.commonpath([self.root, path]) != self.root:
+                return
+            rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+            if rel in self.files:
+                self.dirty.add(rel)
+            else:
+                self.scanned = None
+
+    def save(self, changed):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.records is not None and self.records + len(changed) <= 2 * len(self.files) + 64:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps([rel, entry]) + "\n" for rel, entry in changed.items()))
+            self.records += len(changed)
+            return
+        # first build, or the journal is mostly superseded records: rewrite it compactly
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": INDEX_VERSION, "root": self.root}) + "\n")
+            for rel, entry in self.files.items():
+                f.write(json.dumps([rel, entry]) + "\n")
+        os.replace(tmp, self.path)
+        self.records = len(self.files)
+
+    def search(self, query, k=10):
+        with self.lock:
+            self.update()
+            if not self.chunk_count:
+                return []
+            total, average = self.chunk_count, self.chunk_length / self.chunk_count or 1
+            scores = collections.Counter()
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term, {})
+                found = sum(len(hits) for hits in postings.values())
+                idf = math.log(1 + (total - found + 0.5) / (found + 0.5))
+                for rel, hits in postings.items():
+                    chunks = self.files[rel]["chunks"]
+                    for idx, tf in hits:
+                        norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * chunks[idx][2] / average)
+                        scores[rel, idx] += idf * tf * (BM25_K1 + 1) / norm
+            return [
+                (score, rel, *self.files[rel]["chunks"][idx][:2])
+                for (rel, idx), score in scores.most_common(k)
+            ]
+
+
+def invalidate_indexes(path=None):
+    for index in list(INDEXES.values()):
+        index.invalidate(path)
+
+
+def find_relevant(args):
+    root = os.path.abspath(args.get("path", "."))
+    index = INDEXES.get(root) or INDEXES.setdefault(root, CodeIndex(root))
+    query_terms = set(tokenize(args["query"]))
+    output = []
+    for score, rel, start, end in index.search(args["query"], args.get("k", 10)):
+        output.append(f"{os.path.join(args.get('path', '.'), rel)}:{start + 1}-{end} (score {score:.2f})")
+        try:
+            lines = FILE_CACHE.lines(os.path.join(root, rel))[start:end]
+        except OSError:
+            continue
+        best = max(range(len(lines)), key=lambda idx: len(query_terms & set(tokenize(lines[idx]))), default=None)
+        if best is not None:
+            output.append(f"{start + best + 1:4}| {lines[best].rstrip()[:200]}")
+    return "\n".join(output) or "none"
+
+
+BASH_TIMEOUT = 30
+BASH_HEAD_LINES = 50
+BASH_TAIL_LINES = 50
+RENDER_FPS = 20
+RENDER_LINE_WIDTH = 300
+RENDER_RESERVE = 1000  # room for the marker and status lines under SPILL_THRESHOLD
+RENDER_OUTPUT = True
+RENDER_MAX_LINES = 20
+
+
+class OutputBuffer:
+    """Head + tail line ring buffer; the full stream goes to a spill file once it gets large."""
+
+    def __init__(self, name, head, tail):
+        self.name = name
+        self.head, self.head_size = [], head
+        self.tail = collections.deque(maxlen=tail)
+        self.lines = self.chars = self.truncated = 0
+        self.partial = ""
+        self.pending = []
+        self.spill_file = self.spill_path = None
+
+    def feed(self, text):
+        self.chars += len(text)
+        if self.spill_file:
+            self.spill_file.write(text)
+        else:
+            self.pending.append(text)
+            if self.chars > SPILL_THRESHOLD:
+                self.spill_path = spill_path(self.name)
+                self.spill_file = open(self.spill_path, "w", encoding="utf-8", errors="replace")
+                self.spill_file.writelines(self.pending)
+                self.pending = []
+        parts = (self.partial + text).split("\n")
+        self.partial = parts.pop()[: SPILL_THRESHOLD + 1]
+        return [self._add(line) for line in parts]
+
+    def _add(self, line):
+        # a line this long has already pushed the stream into the spill file, which keeps it whole
+        line = line.rstrip("\r")
+        if len(line) > SPILL_THRESHOLD:
+            line = line[:SPILL_THRESHOLD] + "…"
+            self.truncated += 1
+        self.lines += 1
+        if len(self.head) < self.head_size:
+            self.head.append(line)
+        else:
+            self.tail.append(line)
+        return line
+
+    def close(self):
+        lines = [self._add(self.partial)] if self.partial else []
+        self.partial = ""
+        if self.spill_file:
+            self.spill_file.close()
+            self.spill_file = None
+        return lines
+
+    def since(self, index):
+        tail_start = self.lines - len(self.tail)
+        dropped = max(0, tail_start - max(index, len(self.head)))
+        return self.head[index:], dropped, list(itertools.islice(self.tail, max(0, index - tail_start), None))
+
+    @property
+    def elided(self):
+        return self.lines - len(self.head) - len(self.tail)
+
+    def fit(self, head, tail):
+        """Kept lines may each be up to SPILL_THRESHOLD long; once the stream has spilled, shorten
+        them so an excerpt (and the marker pointing at the spill file) stays under the threshold."""
+        limit = SPILL_THRESHOLD - min(RENDER_RESERVE, SPILL_THRESHOLD // 4)
+        if not self.spill_path or sum(len(line) + 1 for line in head + tail) <= limit:
+            return head, tail, 0
+        width = max(limit // max(len(head) + len(tail), 1) - 2, 1)
+        # lines longer than SPILL_THRESHOLD were already cut (and counted) by _add
+        cut = sum(width < len(line) <= SPILL_THRESHOLD for line in head + tail)
+        head, tail = ([line if len(line) <= width else line[:width] + "…" for line in part] for part in (head, tail))
+        return head, tail, cut
+
+    def render(self):
+        head, tail, cut = self.fit(list(self.head), list(self.tail))
+        truncated = self.truncated + cut
+        output = head
+        notes = [f"{self.elided} lines elided"] if self.elided else []
+        if truncated:
+            notes.append(f"{truncated} long lines truncated")
+        if self.spill_path:
+            notes.append(f"full output ({self.lines} lines) saved to {self.spill_path}, page with read")
+        if notes:
+            output.append(f"... ({'; '.join(notes)}) ...")
+        output.extend(tail)
+        return "\n".join(output)
+
+
+class Renderer:
+    """Draws streamed lines at most RENDER_FPS times a second, dropping what scrolls past."""
+
+    def __init__(self):
+        self.lines = collections.deque(maxlen=RENDER_MAX_LINES)
+        self.skipped = 0
+        self.next_frame = 0
+
+    def add(self, lines):
+        self.skipped += max(0, len(self.lines) + len(lines) - RENDER_MAX_LINES)
+        self.lines.extend(lines)
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not RENDER_OUTPUT or not self.lines or (not force and now < self.next_frame):
+            return
+        self.next_frame = now + 1 / RENDER_FPS
+        frame = [f"  {DIM}│ ... {self.skipped} lines ...{RESET}"] if self.skipped else []
+        frame.extend(f"  {DIM}│ {line[:RENDER_LINE_WIDTH]}{RESET}" for line in self.lines)
+        sys.stdout.write("\n".join(frame) + "\n")
+        sys.stdout.flush()
+        self.lines.clear()
+        self.skipped = 0
+
+
+def spawn(cmd):
+    return subprocess.Popen(
+        cmd, shell=True,
         stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-        text=True
+        start_new_session=os.name != "nt",
     )
-    output_lines = []
+
+
+def kill_process_tree(proc):
     try:
-        while True:
-            line = proc.stdout.readline()
-            if not line and proc.poll() is not None:
-                break
-            if line:
-                print(f"  {DIM}│ {line.rstrip()}{RESET}", flush=True)
-                output_lines.append(line)
-        proc.wait(timeout=30)
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        output_lines.append("\n(timed out after 30s)")
-    return "".join(output_lines).strip() or "(empty)"
+        if os.name == "nt":
+            subprocess.run(
+                f"taskkill /F /T /PID {proc.pid}",
+                shell=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def pump(stream, chunks):
+    for chunk in iter(lambda: os.read(stream.fileno(), 65536), b""):
+        chunks.put(chunk)
+    chunks.put(None)
+
+
+JOB_TAIL_LINES = 200
+JOBS = {}
+JOB_IDS = itertools.count(1)
+
+
+class Job:
+    """Background shell command whose output is collected into a bounded buffer."""
+
+    def __init__(self, cmd, owner=None):
+        self.cmd, self.owner = cmd, owner
+        self.proc = spawn(cmd)
+        self.buffer = OutputBuffer("job", BASH_HEAD_LINES, JOB_TAIL_LINES)
+        self.cursor = 0
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.finished = None
+        threading.Thread(target=self.collect, daemon=True).start()
+
+    def collect(self):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in iter(lambda: os.read(self.proc.stdout.fileno(), 65536), b""):
+            with self.lock:
+                self.buffer.feed(decoder.decode(chunk))
+        self.proc.wait()
+        with self.lock:
+            self.buffer.feed(decoder.decode(b"", final=True))
+            self.buffer.close()
+            self.finished = time.monotonic()
+
+    def status(self):
+        if self.finished is None:
+            state = f"running {time.monotonic() - self.started:.0f}s"
+        else:
+            state = f"exited with code {self.proc.returncode} after {self.finished - self.started:.0f}s"
+        return f"{state}, {self.buffer.lines} lines of output ({self.buffer.lines - self.cursor} unread)"
+
+
+def kill_jobs(owner=None):
+    """Kills every running job at exit, or one session's jobs (which are then forgotten) on close."""
+    for job_id, job in list(JOBS.items()):
+        if owner is None or job.owner == owner:
+            if job.proc.poll() is None:
+                kill_process_tree(job.proc)
+            if owner is not None:
+                del JOBS[job_id]
+
+
+atexit.register(kill_jobs)
+
+
+def _job_owner():
+    turn = current_turn()
+    return turn.owner if turn else None
+
+
+def _job(args):
+    job_id = int(args["id"])
+    job = JOBS.get(job_id)
+    if job is None or job.owner != _job_owner():
+        raise ValueError(f"no job {job_id}")
+    return job_id, job
+
+
+def job_status(args):
+    if args.get("id") is None:
+        owner = _job_owner()
+        lines = [f"{job_id}: {job.cmd} ({job.status()})" for job_id, job in JOBS.items() if job.owner == owner]
+        return "\n".join(lines) or "no jobs"
+    job_id, job = _job(args)
+    return f"{job_id}: {job.status()}"
+
+
+def job_output(args):
+    job_id, job = _job(args)
+    with job.lock:
+        head, dropped, tail = job.buffer.since(job.cursor)
+        head, tail, _cut = job.buffer.fit(head, tail)
+        job.cursor = job.buffer.lines
+        spilled = job.buffer.spill_path
+    if dropped:
+        note = f"... ({dropped} lines dropped"
+        note += f"; full output saved to {spilled}, page with read) ..." if spilled else ") ..."
+        head.append(note)
+    return "\n".join(head + tail) or f"(no new output; job {job.status()})"
+
+
+def job_kill(args):
+    job_id, job = _job(args)
+    if job.proc.poll() is not None:
+        return f"{job_id}: already exited with code {job.proc.returncode}"
+    kill_process_tree(job.proc)
+    job.proc.wait()
+    return f"{job_id}: killed"
+
+
+def bash(args):
+    if args.get("background"):
+        job_id = next(JOB_IDS)
+        JOBS[job_id] = Job(args["cmd"], _job_owner())
+        return f"started job {job_id}; use job_status/job_output/job_kill with id={job_id}"
+    proc = spawn(args["cmd"])
+    chunks = queue.Queue()
+    threading.Thread(target=pump, args=(proc.stdout, chunks), daemon=True).start()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer, renderer = OutputBuffer("bash", BASH_HEAD_LINES, BASH_TAIL_LINES), Renderer()
+    deadline = time.monotonic() + BASH_TIMEOUT
+    timed_out = False
+    turn = current_turn()
+    while True:
+        if turn and turn.cancelled.is_set():
+            kill_process_tree(proc)
+            buffer.close()
+            proc.wait()
+            raise TurnCancelled()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            kill_process_tree(proc)
+            timed_out = True
+            break
+        try:
+            chunk = chunks.get(timeout=min(remaining, 1 / RENDER_FPS))
+        except queue.Empty:
+            renderer.flush()
+            continue
+        if chunk is None:
+            break
+        renderer.add(buffer.feed(decoder.decode(chunk)))
+        renderer.flush()
+    while timed_out:
+        # keep what the command wrote before it was killed
+        try:
+            chunk = chunks.get(timeout=1)
+        except queue.Empty:
+            break
+        if chunk is None:
+            break
+        renderer.add(buffer.feed(decoder.decode(chunk)))
+    renderer.add(buffer.feed(decoder.decode(b"", final=True)) + buffer.close())
+    renderer.flush(force=True)
+    proc.wait()
+    output = buffer.render().strip()
+    if timed_out:
+        output += f"\n(timed out after {BASH_TIMEOUT}s)"
+    return output.strip() or "(empty)"
 
 
 # --- Tool definitions: (description, schema, function) ---
@@ -270,6 +1029,12 @@ TOOLS = {
         {"path": "string", "offset": "number?", "limit": "number?"},
         read,
     ),
+    "read_many": (
+        "Read several files or line ranges in one call; files is a list of "
+        "{path, offset?, limit?} objects, output is capped at budget characters",
+        {"files": "array", "budget": "number?"},
+        read_many,
+    ),
     "write": (
         "Write content to file",
         {"path": "string", "content": "string"},
@@ -286,23 +1051,229 @@ TOOLS = {
         glob,
     ),
     "grep": (
-        "Search files for regex pattern",
-        {"pat": "string", "path": "string?"},
+        "Search files for regex pattern (skips .gitignore'd and binary files; "
+        "include/exclude are comma-separated globs, context is lines around each hit)",
+        {
+            "pat": "string",
+            "path": "string?",
+            "context": "number?",
+            "include": "string?",
+            "exclude": "string?",
+        },
         grep,
     ),
+    "find_relevant": (
+        "Rank files/line spans relevant to a natural-language or identifier query "
+        "(local BM25 index, returns top k)",
+        {"query": "string", "k": "number?", "path": "string?"},
+        find_relevant,
+    ),
     "bash": (
-        "Run shell command",
-        {"cmd": "string"},
+        "Run shell command (30s timeout); background=true starts a job and returns its id",
+        {"cmd": "string", "background": "boolean?"},
         bash,
     ),
+    "job_status": (
+        "Show status of a background job, or list all jobs when id is omitted",
+        {"id": "number?"},
+        job_status,
+    ),
+    "job_output": (
+        "Return output of a background job produced since the last job_output call",
+        {"id": "number"},
+        job_output,
+    ),
+    "job_kill": (
+        "Kill a background job",
+        {"id": "number"},
+        job_kill,
+    ),
 }
 
 
+SPILL_THRESHOLD = int(os.environ.get("NANOCODE_SPILL_THRESHOLD", "32000"))
+SPILL_EXCERPT = 4000
+SPILL_DIR = None
+SPILL_LOCK = threading.Lock()
+
+
+def spill_dir():
+    # tool workers get the parent's directory (see tool_worker_main), so this only runs in the parent
+    global SPILL_DIR
+    with SPILL_LOCK:
+        if SPILL_DIR is None:
+            SPILL_DIR = tempfile.mkdtemp(prefix="nanocode-")
+            atexit.register(shutil.rmtree, SPILL_DIR, ignore_errors=True)
+        return SPILL_DIR
+
+
+def spill_path(name, suffix=".txt"):
+    handle, path = tempfile.mkstemp(prefix=f"{name}-", suffix=suffix, dir=spill_dir())
+    os.close(handle)
+    return path
+
+
+def spill(name, result):
+    if len(result) <= SPILL_THRESHOLD:
+        return result
+    if name in ("read", "read_many"):
+        # the source file can be paged directly; a copy would number every line twice
+        where = "page through the file with read using offset/limit"
+    else:
+        path = spill_path(name)
+        with open(path, "w", encoding="utf-8", errors="replace") as f:
+            f.write(result)
+        where = f"full output saved to {path}, page through it with read using offset/limit"
+    head = result[:SPILL_EXCERPT].rsplit("\n", 1)[0]
+    tail = result[-SPILL_EXCERPT:].split("\n", 1)[-1]
+    total = result.count("\n") + (not result.endswith("\n"))
+    return f"{head}\n... ({total} lines, {len(result)} chars; {where}) ...\n{tail}"
+
+
+# --- Tool worker pool ---
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, tools run in-process
+    resource = None
+
+POOL_TOOLS = {"read", "read_many", "glob", "grep"}
+TOOL_WORKERS = int(os.environ.get("NANOCODE_TOOL_WORKERS", "2"))
+TOOL_MEMORY_MB = int(os.environ.get("NANOCODE_TOOL_MEMORY_MB", "2048"))
+TOOL_WORKER_MAX_TASKS = 200
+TOOL_TIMEOUTS = {}
+TOOL_TIMEOUT = 60
+TOOL_POOL = None
+
+
+def tool_worker_main(conn, memory_mb, spill_dir):
+    global SPILL_DIR
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is handled by the parent
+    # workers are killed without running atexit, so spill into the parent's directory, which it removes
+    SPILL_DIR = spill_dir
+    if resource and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    while True:
+        try:
+            name, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            result = TOOLS[name][2](args)
+        except MemoryError:
+            result = f"error: {name} exceeded the {memory_mb} MB tool memory limit"
+        except Exception as err:
+            result = f"error: {err}"
+        conn.send(result)
+
+
+class ToolWorker:
+    def __init__(self, ctx, memory_mb):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=tool_worker_main, args=(child, memory_mb, spill_dir()), daemon=True)
+        self.process.start()
+        child.close()
+        self.tasks = 0
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ToolPool:
+    """Pre-started worker processes for CPU/memory-heavy tools: per-tool timeouts, a memory
+    rlimit, and recycling after crashes, timeouts or TOOL_WORKER_MAX_TASKS calls."""
+
+    def __init__(self, size, memory_mb=TOOL_MEMORY_MB, max_tasks=TOOL_WORKER_MAX_TASKS):
+        # forkserver children come from a clean single-threaded process, never from our threads
+        self.ctx = multiprocessing.get_context("forkserver")
+        self.memory_mb, self.max_tasks = memory_mb, max_tasks
+        self.size, self.missing = size, size
+        self.lock = threading.Lock()
+        self.idle = queue.Queue()
+        self.replenish()
+
+    def replenish(self):
+        # a worker that fails to start is retried on the next call
+        with self.lock:
+            while self.missing:
+                try:
+                    worker = ToolWorker(self.ctx, self.memory_mb)
+                except Exception:
+                    return
+                self.missing -= 1
+                self.idle.put(worker)
+
+    def run(self, name, args, timeout=None):
+        timeout = timeout or TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT)
+        turn = current_turn()
+        deadline = time.monotonic() + timeout  # time spent queued for a worker counts too
+        self.replenish()
+        while True:
+            if turn:
+                turn.check()
+            if self.missing >= self.size:
+                # no worker could be started: better to run unprotected than not at all
+                return TOOLS[name][2](args)
+            try:
+                worker = self.idle.get(timeout=0.05)
+                break
+            except queue.Empty:
+                if time.monotonic() > deadline:
+                    return f"error: {name} timed out after {timeout}s waiting for a tool worker"
+        result = None
+        try:
+            worker.conn.send((name, args))
+            while worker.process.is_alive() or worker.conn.poll():
+                if worker.conn.poll(0.05):
+                    result = worker.conn.recv()
+                    return result
+                if turn:
+                    turn.check()
+                if time.monotonic() > deadline:
+                    return f"error: {name} timed out after {timeout}s"
+        except (EOFError, OSError):
+            pass
+        finally:
+            worker.tasks += 1
+            if result is None or worker.tasks >= self.max_tasks:
+                worker.kill()
+                with self.lock:
+                    self.missing += 1
+                self.replenish()
+            else:
+                self.idle.put(worker)
+        return f"error: {name} worker crashed (exit code {worker.process.exitcode})"
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get().kill()
+
+
+def start_tool_pool():
+    global TOOL_POOL
+    if TOOL_POOL is None and TOOL_WORKERS > 0 and os.name != "nt":
+        TOOL_POOL = ToolPool(TOOL_WORKERS)
+        atexit.register(TOOL_POOL.close)
+    return TOOL_POOL
+
+
 def run_tool(name, args):
     try:
-        return TOOLS[name][2](args)
+        if TOOL_POOL and name in POOL_TOOLS:
+            return spill(name, TOOL_POOL.run(name, args))
+        return spill(name, TOOLS[name][2](args))
+    except TurnCancelled:
+        raise
     except Exception as err:
         return f"error: {err}"
+    finally:
+        if name in ("write", "edit"):
+            invalidate_indexes(args.get("path"))
+        elif name not in READ_ONLY_TOOLS:
+            invalidate_indexes()
 
 
 def make_schema():
@@ -316,6 +1287,8 @@ def make_schema():
             properties[param_name] = {
                 "type": "integer" if base_type == "number" else base_type
             }
+            if base_type == "array":
+                properties[param_name]["items"] = {"type": "object"}
             if not is_optional:
                 required.append(param_name)
         result.append(
@@ -410,9 +1383,10 @@ def messages_to_openai(messages, system_prompt):
     return converted
 
 
-def messages_to_ollama(messages, system_prompt):
+def messages_to_ollama(messages, system_prompt, name_map=None):
     converted = [{"role": "system", "content": system_prompt}]
-    name_map = _tool_name_map(messages)
+    if name_map is None:
+        name_map = _tool_name_map(messages)
     for message in messages:
         role = message.get("role")
         content = message.get("content")
@@ -458,6 +1432,25 @@ def messages_to_ollama(messages, system_prompt):
     return converted
 
 
+def new_tool_id():
+    return f"call_{uuid.uuid4().hex[:24]}"
+
+
+def _openai_tool_use(tool_call):
+    function = tool_call.get("function", {})
+    arguments = function.get("arguments", "{}")
+    try:
+        parsed = json.loads(arguments) if isinstance(arguments, str) else arguments
+    except Exception:
+        parsed = {}
+    return {
+        "type": "tool_use",
+        "id": tool_call.get("id") or new_tool_id(),
+        "name": function.get("name", ""),
+        "input": parsed,
+    }
+
+
 def parse_openai_response(response):
     message = response.get("choices", [{}])[0].get("message", {})
     blocks = []
@@ -465,21 +1458,15 @@ def parse_openai_response(response):
     if content:
         blocks.append({"type": "text", "text": content})
     for tool_call in message.get("tool_calls", []) or []:
-        function = tool_call.get("function", {})
-        arguments = function.get("arguments", "{}")
-        try:
-            parsed = json.loads(arguments) if isinstance(arguments, str) else arguments
-        except Exception:
-            parsed = {}
-        blocks.append(
-            {
-                "type": "tool_use",
-                "id": tool_call.get("id", ""),
-                "name": function.get("name", ""),
-                "input": parsed,
-            }
-        )
-    return {"content": blocks}
+        blocks.append(_openai_tool_use(tool_call))
+    usage = response.get("usage") or {}
+    return {
+        "content": blocks,
+        "usage": {
+            "input_tokens": usage.get("prompt_tokens", 0),
+            "output_tokens": usage.get("completion_tokens", 0),
+        },
+    }
 
 
 def parse_ollama_response(response):
@@ -498,65 +1485,658 @@ def parse_ollama_response(response):
         blocks.append(
             {
                 "type": "tool_use",
-                "id": tool_call.get("id", function.get("name", "")),
+                "id": tool_call.get("id") or new_tool_id(),
                 "name": function.get("name", ""),
                 "input": parsed,
             }
         )
-    return {"content": blocks}
+    return {
+        "content": blocks,
+        "usage": {
+            "input_tokens": response.get("prompt_eval_count", 0),
+            "output_tokens": response.get("eval_count", 0),
+        },
+    }
+
+
+MEMORY_CAP = int(os.environ.get("NANOCODE_MEMORY_CAP", str(32 * 1024 * 1024)))
+KEEP_RECENT_MESSAGES = 6
+OFFLOAD_MIN_CHARS = 1024
+
+
+class StoredBlock(dict):
+    """tool_result block whose content is read back from a MessageStore on access."""
+
+    def __init__(self, store, key, block):
+        super().__init__((name, value) for name, value in block.items() if name != "content")
+        self.store, self.key = store, key
+
+    def __missing__(self, name):
+        if name == "content":
+            return self.store.load(self.key)
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        return self[name] if name == "content" or name in self else default
+
+
+class MessageStore:
+    """SQLite file holding offloaded tool_result bodies; keeps resident history under a cap."""
+
+    def __init__(self, cap=None, keep_recent=KEEP_RECENT_MESSAGES):
+        self.cap = MEMORY_CAP if cap is None else cap
+        self.keep_recent = keep_recent
+        self.db = None
+        self.lock = threading.Lock()
+
+    def save(self, content):
+        with self.lock:
+            if self.db is None:
+                self.db = sqlite3.connect(spill_path("messages", ".sqlite"), check_same_thread=False)
+                self.db.execute("CREATE TABLE bodies (id INTEGER PRIMARY KEY, content TEXT)")
+            return self.db.execute("INSERT INTO bodies (content) VALUES (?)", (content,)).lastrowid
+
+    def load(self, key):
+        with self.lock:
+            return self.db.execute("SELECT content FROM bodies WHERE id = ?", (key,)).fetchone()[0]
+
+    def compact(self, messages):
+        """Offloads the oldest tool_result bodies until they, plus the encoded fragments a History
+        caches, fit under the cap; returns the resident total."""
+        nodes = list(messages.nodes()) if isinstance(messages, History) else [HistoryNode(m, None) for m in messages]
+        resident, total = [], 0
+        for position, node in enumerate(nodes):
+            total += sum(len(fragment) for fragment in node.fragments.values())
+            content = node.message.get("content")
+            if isinstance(content, list):
+                for idx, block in enumerate(content):
+                    if block.get("type") == "tool_result" and not isinstance(block, StoredBlock):
+                        resident.append((position, node, idx, len(block["content"])))
+        total += sum(size for *_rest, size in resident)
+        horizon = len(nodes) - self.keep_recent
+        for position, node, idx, size in resident:
+            if total <= self.cap or position >= horizon:
+                break
+            if size >= OFFLOAD_MIN_CHARS:
+                blocks = node.message["content"]
+                blocks[idx] = StoredBlock(self, self.save(blocks[idx]["content"]), blocks[idx])
+                # encode_messages won't cache this message again now that it holds a StoredBlock
+                total -= size + sum(len(fragment) for fragment in node.fragments.values())
+                node.fragments.clear()
+        return total
+
+
+def materialize(messages):
+    """Plain-dict copy of messages with stored tool_result bodies loaded, for JSON encoding."""
+    converted = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list) and any(isinstance(block, StoredBlock) for block in content):
+            content = [{**block, "content": block["content"]} if isinstance(block, StoredBlock) else block for block in content]
+            message = {**message, "content": content}
+        converted.append(message)
+    return converted
 
 
-def call_api(messages, system_prompt):
-    if PROVIDER is None:
-        raise ValueError("Provider not initialized")
-    if PROVIDER["kind"] == "openai":
+class HistoryNode:
+    __slots__ = ("message", "parent", "length", "fragments")
+
+    def __init__(self, message, parent):
+        self.message, self.parent = message, parent
+        self.length = parent.length + 1 if parent else 1
+        self.fragments = {}
+
+
+class History:
+    """Append-only message list kept as a chain of shared nodes: fork() is O(1), appends to a
+    fork never touch the parent, and every fork reuses the per-node fragments encode_messages caches."""
+
+    def __init__(self, messages=(), head=None):
+        self.head = head
+        for message in messages:
+            self.append(message)
+
+    def append(self, message):
+        self.head = HistoryNode(message, self.head)
+
+    def fork(self):
+        return History(head=self.head)
+
+    def nodes(self):
+        chain, node = [], self.head
+        while node:
+            chain.append(node)
+            node = node.parent
+        return reversed(chain)
+
+    def __iter__(self):
+        return (node.message for node in self.nodes())
+
+    def __len__(self):
+        return self.head.length if self.head else 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        node = self.head
+        for _ in range(len(self) - 1 - index):
+            node = node.parent
+        return node.message
+
+
+class RawJSON(str):
+    """Already-encoded JSON value that encode_payload splices in verbatim."""
+
+
+def encode_payload(payload):
+    raw = {key: value for key, value in payload.items() if isinstance(value, RawJSON)}
+    text = json.dumps({key: value for key, value in payload.items() if key not in raw})
+    for key, value in raw.items():
+        text = f"{text[:-1]}{', ' if len(text) > 2 else ''}{json.dumps(key)}: {value}}}"
+    return text.encode()
+
+
+def _wire_messages(kind, message, previous):
+    if kind == "openai":
+        return messages_to_openai([message], "")[1:]
+    if kind == "ollama":
+        return messages_to_ollama([message], "", _tool_name_map([previous] if previous else []))[1:]
+    return materialize([message])
+
+
+def encode_messages(messages, kind, system_prompt):
+    """JSON array of messages in the provider's wire format. Fragments are cached on History nodes,
+    except for messages holding StoredBlocks, whose bodies must not stay resident."""
+    if not isinstance(messages, History):
+        messages = History(messages)
+    parts = [] if kind == "anthropic" else [json.dumps({"role": "system", "content": system_prompt})]
+    previous = None
+    for node in messages.nodes():
+        content = node.message.get("content")
+        if isinstance(content, list) and any(isinstance(block, StoredBlock) for block in content):
+            node.fragments.clear()
+            fragment = ", ".join(json.dumps(item) for item in _wire_messages(kind, node.message, previous))
+        elif kind in node.fragments:
+            fragment = node.fragments[kind]
+        else:
+            fragment = node.fragments[kind] = ", ".join(
+                json.dumps(item) for item in _wire_messages(kind, node.message, previous)
+            )
+        if fragment:
+            parts.append(fragment)
+        previous = node.message
+    return RawJSON("[" + ", ".join(parts) + "]")
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections shared by every session in the process."""
+
+    def __init__(self, per_host=8):
+        self.per_host = per_host
+        self.idle = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+    def post(self, url, body, headers, timeout=60, consume=None):
+        """POST body and return consume(response), by default the whole response body."""
+        consume = consume or (lambda response: response.read())
+        parts = urllib.parse.urlsplit(url)
+        if urllib.request.getproxies().get(parts.scheme) and not urllib.request.proxy_bypass(parts.hostname):
+            request = urllib.request.Request(url, data=body, headers=headers)
+            return consume(urllib.request.urlopen(request, timeout=timeout))
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        turn = current_turn()
+        conn = None
+        abort = lambda: conn and self.abort(conn)
+        if turn:
+            turn.aborts.add(abort)
+        try:
+            while True:
+                with self.lock:
+                    conn = self.idle[key].pop() if self.idle[key] else None
+                fresh = conn is None
+                if fresh:
+                    conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                    conn = conn_class(parts.netloc, timeout=timeout)
+                else:
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                try:
+                    if turn:
+                        turn.check()
+                    conn.request("POST", path or "/", body=body, headers=headers)
+                    response = conn.getresponse()
+                    break
+                except (http.client.HTTPException, OSError) as err:
+                    conn.close()
+                    if turn:
+                        turn.check()
+                    # retry only when the server dropped an idle keep-alive connection before answering;
+                    # anything else (a timeout in particular) may mean the request was already processed
+                    if fresh or not isinstance(err, (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)):
+                        raise
+                except TurnCancelled:
+                    conn.close()
+                    raise
+            try:
+                if response.status >= 400:
+                    detail = response.read()[:500].decode(errors="replace")
+                    raise urllib.error.HTTPError(url, response.status, f"{response.reason}: {detail}", response.headers, None)
+                data = consume(response)
+            except BaseException:
+                conn.close()
+                if turn:
+                    turn.check()
+                raise
+        finally:
+            if turn:
+                turn.aborts.discard(abort)
+        if response.will_close:
+            conn.close()
+        else:
+            with self.lock:
+                if len(self.idle[key]) < self.per_host:
+                    self.idle[key].append(conn)
+                else:
+                    conn.close()
+        return data
+
+    @staticmethod
+    def abort(conn):
+        try:
+            conn.sock and conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+HTTP_POOL = ConnectionPool()
+STREAM_RESPONSES = os.environ.get("NANOCODE_STREAM", "") == "1"
+
+
+def post_json(provider, payload, extra_headers=None):
+    data = HTTP_POOL.post(
+        provider["api_url"],
+        encode_payload(payload),
+        {"Content-Type": "application/json", **(extra_headers or {}), **provider["headers"]},
+    )
+    return json.loads(data)
+
+
+def post_stream(provider, payload, consume, extra_headers=None):
+    return HTTP_POOL.post(
+        provider["api_url"],
+        encode_payload(payload),
+        {"Content-Type": "application/json", **(extra_headers or {}), **provider["headers"]},
+        consume=consume,
+    )
+
+
+def sse_events(response):
+    for raw in response:
+        line = raw.decode("utf-8", errors="replace").strip()
+        if line.startswith("data:") and line[5:].strip() != "[DONE]":
+            yield json.loads(line[5:])
+
+
+def read_openai_stream(response, on_tool_use):
+    """Rebuild a chat completion from SSE chunks, reporting each tool call once its arguments are complete."""
+    text, calls, usage = [], [], {}
+
+    def finish(index):
+        if 0 <= index < len(calls) and not calls[index].get("done"):
+            calls[index]["done"] = True
+            calls[index]["id"] = calls[index]["id"] or new_tool_id()
+            on_tool_use(_openai_tool_use(calls[index]))
+
+    for event in sse_events(response):
+        usage = event.get("usage") or usage
+        for choice in event.get("choices", []):
+            delta = choice.get("delta", {})
+            text.append(delta.get("content") or "")
+            for call in delta.get("tool_calls") or []:
+                index = call.get("index", len(calls))
+                while len(calls) <= index:
+                    finish(len(calls) - 1)
+                    calls.append({"id": "", "function": {"name": "", "arguments": ""}})
+                calls[index]["id"] = call.get("id") or calls[index]["id"]
+                function = call.get("function", {})
+                calls[index]["function"]["name"] += function.get("name") or ""
+                calls[index]["function"]["arguments"] += function.get("arguments") or ""
+            if choice.get("finish_reason") and calls:
+                finish(len(calls) - 1)
+    if calls:
+        finish(len(calls) - 1)
+    message = {"content": "".join(text), "tool_calls": calls}
+    return parse_openai_response({"choices": [{"message": message}], "usage": usage})
+
+
+def read_anthropic_stream(response, on_tool_use):
+    """Rebuild a Messages API response from SSE events, reporting each tool_use at content_block_stop."""
+    blocks, partial_json, usage = {}, collections.defaultdict(list), {}
+    for event in sse_events(response):
+        kind, index = event.get("type"), event.get("index")
+        if kind == "message_start":
+            usage.update(event["message"].get("usage") or {})
+        elif kind == "content_block_start":
+            blocks[index] = dict(event["content_block"])
+        elif kind == "content_block_delta":
+            delta = event["delta"]
+            if delta["type"] == "input_json_delta":
+                partial_json[index].append(delta["partial_json"])
+            elif delta["type"] == "text_delta":
+                blocks[index]["text"] = blocks[index].get("text", "") + delta["text"]
+            elif delta["type"] == "thinking_delta":
+                blocks[index]["thinking"] = blocks[index].get("thinking", "") + delta["thinking"]
+            elif delta["type"] == "signature_delta":
+                blocks[index]["signature"] = delta["signature"]
+        elif kind == "content_block_stop" and blocks[index]["type"] == "tool_use":
+            try:
+                blocks[index]["input"] = json.loads("".join(partial_json[index]) or "{}")
+            except ValueError:
+                blocks[index]["input"] = {}
+            on_tool_use(blocks[index])
+        elif kind == "message_delta":
+            usage.update(event.get("usage") or {})
+        elif kind == "error":
+            raise ValueError(event.get("error", {}).get("message", "stream error"))
+    return {"content": [blocks[index] for index in sorted(blocks)], "usage": usage}
+
+
+def call_api(messages, system_prompt, provider, on_tool_use=None):
+    """With NANOCODE_STREAM=1 and an openai or anthropic provider, on_tool_use is called with each
+    tool_use block as soon as it is complete, while the response is still streaming. Otherwise
+    it is never called and callers run tools from the returned response."""
+    stream = STREAM_RESPONSES and on_tool_use is not None
+    if provider["kind"] == "openai":
         payload = {
-            "model": MODEL,
-            "messages": messages_to_openai(messages, system_prompt),
+            "model": provider["model"],
+            "messages": encode_messages(messages, "openai", system_prompt),
             "tools": tools_to_openai(make_schema()),
-            "stream": False,
-            **PROVIDER["extra"],
+            "stream": stream,
+            **({"stream_options": {"include_usage": True}} if stream else {}),
+            **provider["extra"],
         }
-        request = urllib.request.Request(
-            API_URL,
-            data=json.dumps(payload).encode(),
-            headers={"Content-Type": "application/json", **PROVIDER["headers"]},
-        )
-        response = urllib.request.urlopen(request, timeout=60)
-        return parse_openai_response(json.loads(response.read()))
-    if PROVIDER["kind"] == "ollama":
+        if stream:
+            return post_stream(provider, payload, lambda response: read_openai_stream(response, on_tool_use))
+        return parse_openai_response(post_json(provider, payload))
+    if provider["kind"] == "ollama":
         payload = {
-            "model": MODEL,
-            "messages": messages_to_ollama(messages, system_prompt),
+            "model": provider["model"],
+            "messages": encode_messages(messages, "ollama", system_prompt),
             "tools": tools_to_ollama(make_schema()),
             "stream": False,
         }
-        request = urllib.request.Request(
-            API_URL,
-            data=json.dumps(payload).encode(),
-            headers={"Content-Type": "application/json", **PROVIDER["headers"]},
-        )
-        response = urllib.request.urlopen(request, timeout=60)
-        return parse_ollama_response(json.loads(response.read()))
-    request = urllib.request.Request(
-        API_URL,
-        data=json.dumps(
-            {
-                "model": MODEL,
-                "max_tokens": 8192,
-                "system": system_prompt,
-                "messages": messages,
-                "tools": make_schema(),
-            }
-        ).encode(),
-        headers={
-            "Content-Type": "application/json",
-            "anthropic-version": "2023-06-01",
-            **PROVIDER["headers"],
-        },
-    )
-    response = urllib.request.urlopen(request, timeout=60)
-    return json.loads(response.read())
+        return parse_ollama_response(post_json(provider, payload))
+    payload = {
+        "model": provider["model"],
+        "max_tokens": 8192,
+        "system": system_prompt,
+        "messages": encode_messages(messages, "anthropic", system_prompt),
+        "tools": make_schema(),
+        **({"stream": True} if stream else {}),
+    }
+    headers = {"anthropic-version": "2023-06-01"}
+    if stream:
+        return post_stream(provider, payload, lambda response: read_anthropic_stream(response, on_tool_use), headers)
+    return post_json(provider, payload, headers)
+
+
+READ_ONLY_TOOLS = {"read", "read_many", "glob", "grep", "find_relevant"}
+
+
+class Router:
+    """Sends read-only tool continuations to a fast model and everything else to the primary."""
+
+    def __init__(self, primary, fast=None):
+        self.primary, self.fast = primary, fast
+        self.stats = {
+            role: {"calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0}
+            for role in ("primary", "fast")
+        }
+        self.escalations = 0
+        self.wasted_tokens = 0  # fast-model tokens spent on replies that were then redone by the primary
+
+    def choose(self, messages):
+        if not self.fast or len(messages) < 2 or messages[-1]["role"] != "user":
+            return "primary"
+        results, calls = messages[-1]["content"], messages[-2]["content"]
+        # a fresh user request needs planning; failures need the stronger model
+        if not isinstance(results, list) or not isinstance(calls, list):
+            return "primary"
+        if any(block["type"] == "tool_result" and block["content"].startswith("error") for block in results):
+            return "primary"
+        if any(block["type"] == "tool_use" and block["name"] not in READ_ONLY_TOOLS for block in calls):
+            return "primary"
+        return "fast"
+
+    def call(self, messages, system_prompt, escalated=False, dispatcher=None):
+        """Returns (response, role); a fast reply that fails, is empty or calls a mutating tool is
+        retried on the primary and reported as "escalated". choose() only picks the fast model after
+        a clean read-only step, so a plain-text answer from it is kept."""
+        if not escalated and self.choose(messages) == "fast":
+            response = None
+            try:
+                response = self.timed("fast", messages, system_prompt, dispatcher)
+                content = response.get("content", [])
+                tool_uses = [block for block in content if block["type"] == "tool_use"]
+                if not tool_uses and any(block["type"] == "text" and block["text"].strip() for block in content):
+                    return response, "fast"
+                # the fast model may only gather context; changes go through the primary
+                if tool_uses and all(block["name"] in READ_ONLY_TOOLS for block in tool_uses):
+                    # small local models often reuse ids, which the primary rejects once they are in history
+                    seen = {
+                        block.get("id")
+                        for message in messages
+                        if isinstance(message["content"], list)
+                        for block in message["content"]
+                        if block.get("type") == "tool_use"
+                    }
+                    for block in tool_uses:
+                        if block["id"] in seen:
+                            block["id"] = new_tool_id()
+                        seen.add(block["id"])
+                    return response, "fast"
+            except TurnCancelled:
+                raise
+            except Exception:
+                pass
+            self.escalations += 1
+            if response:
+                usage = response.get("usage") or {}
+                self.wasted_tokens += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+            return self.timed("primary", messages, system_prompt, dispatcher), "escalated"
+        return self.timed("primary", messages, system_prompt, dispatcher), "primary"
+
+    def timed(self, role, messages, system_prompt, dispatcher=None):
+        started = time.monotonic()
+        provider = self.fast if role == "fast" else self.primary
+        if dispatcher:
+            dispatcher.reset()
+            response = call_api(messages, system_prompt, provider, dispatcher.submit)
+        else:
+            response = call_api(messages, system_prompt, provider)
+        stats = self.stats[role]
+        stats["calls"] += 1
+        stats["seconds"] += time.monotonic() - started
+        usage = response.get("usage") or {}
+        stats["input_tokens"] += usage.get("input_tokens", 0)
+        stats["output_tokens"] += usage.get("output_tokens", 0)
+        return response
+
+    def summary(self):
+        parts = []
+        for role, provider in (("primary", self.primary), ("fast", self.fast)):
+            if provider:
+                stats = self.stats[role]
+                tokens = stats["input_tokens"] + stats["output_tokens"]
+                parts.append(
+                    f"{role} {provider['model']}: {stats['calls']} calls, "
+                    f"{stats['seconds']:.1f}s, {tokens} tokens"
+                )
+        if self.fast:
+            fast = self.stats["fast"]
+            kept = fast["input_tokens"] + fast["output_tokens"] - self.wasted_tokens
+            parts.append(
+                f"{kept} tokens kept off the primary, {self.escalations} escalations "
+                f"({self.wasted_tokens} fast tokens wasted)"
+            )
+        return " | ".join(parts)
+
+
+class SpeculativeDispatcher:
+    """Starts read-only tools as their tool_use blocks arrive, until a mutating tool shows up."""
+
+    def __init__(self, turn):
+        self.turn = turn
+        self.pool = ThreadPoolExecutor(max_workers=4)
+        self.reset()
+
+    def reset(self):
+        self.futures = {}
+        self.blocked = False
+
+    def submit(self, block):
+        # a read after an edit/write/bash in the same response must see its effects
+        if self.blocked or block["name"] not in READ_ONLY_TOOLS:
+            self.blocked = True
+            return
+        self.futures[self.key(block)] = self.pool.submit(self.run, block["name"], block["input"])
+
+    @staticmethod
+    def key(block):
+        # by call rather than id: ids may be missing or repeated, and the router may rewrite them
+        return json.dumps([block["name"], block["input"]], sort_keys=True)
+
+    def run(self, name, args):
+        TURN.turn = self.turn
+        return run_tool(name, args)
+
+    def result(self, block):
+        future = self.futures.pop(self.key(block), None)
+        return future.result() if future else run_tool(block["name"], block["input"])
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class Session:
+    """Per-conversation state: provider, history and system prompt."""
+
+    def __init__(self, provider, fast_provider=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.provider = provider
+        self.router = Router(provider, fast_provider)
+        self.messages = History()
+        self.system_prompt = f"Concise coding assistant. cwd: {os.getcwd()}"
+        self.lock = threading.Lock()
+        self.turn = None
+        self.store = MessageStore()
+        self.parent = None
+        self.job_owner = self.id
+
+    def cancel(self):
+        if self.turn:
+            self.turn.cancel()
+
+    def fork(self):
+        """New session continuing from this one's history; both share its nodes and message store."""
+        child = Session(self.provider, self.router.fast)
+        child.messages = self.messages.fork()
+        child.system_prompt = self.system_prompt
+        child.store = self.store
+        child.parent = self.id
+        child.job_owner = self.job_owner
+        return child
+
+
+def run_turn(session, user_input, emit):
+    turn = session.turn = TURN.turn = Turn(session.job_owner)
+    session.messages.append({"role": "user", "content": user_input})
+
+    escalated = False
+    dispatcher = SpeculativeDispatcher(turn) if STREAM_RESPONSES else None
+
+    try:
+        # agentic loop: keep calling API until no more tool calls
+        while True:
+            started = time.monotonic()
+            response, role = session.router.call(session.messages, session.system_prompt, escalated, dispatcher)
+            turn.check()
+            if session.router.fast:
+                escalated = escalated or role == "escalated"
+                emit({"type": "route", "role": role, "seconds": round(time.monotonic() - started, 3)})
+            content_blocks = response.get("content", [])
+            tool_results = []
+
+            try:
+                for block in content_blocks:
+                    if block["type"] == "text":
+                        emit({"type": "text", "text": block["text"]})
+
+                    if block["type"] == "tool_use":
+                        emit({"type": "tool_use", "id": block["id"], "name": block["name"], "input": block["input"]})
+                        turn.check()
+                        result = dispatcher.result(block) if dispatcher else run_tool(block["name"], block["input"])
+                        emit({"type": "tool_result", "id": block["id"], "name": block["name"], "content": result})
+                        tool_results.append(
+                            {
+                                "type": "tool_result",
+                                "tool_use_id": block["id"],
+                                "content": result,
+                            }
+                        )
+            except TurnCancelled:
+                # every tool_use still needs a tool_result for the history to stay valid
+                done = {result["tool_use_id"] for result in tool_results}
+                for block in content_blocks:
+                    if block["type"] == "tool_use" and block["id"] not in done:
+                        tool_results.append(
+                            {
+                                "type": "tool_result",
+                                "tool_use_id": block["id"],
+                                "content": "(cancelled by user)",
+                            }
+                        )
+                session.messages.append({"role": "assistant", "content": content_blocks})
+                session.messages.append({"role": "user", "content": tool_results})
+                raise
+
+            session.messages.append({"role": "assistant", "content": content_blocks})
+
+            if not tool_results:
+                return
+            session.messages.append({"role": "user", "content": tool_results})
+            session.store.compact(session.messages)
+    except TurnCancelled:
+        session.messages.append({"role": "assistant", "content": [{"type": "text", "text": "(interrupted by user)"}]})
+        emit({"type": "cancelled"})
+    finally:
+        session.turn = TURN.turn = None
+        if dispatcher:
+            dispatcher.close()
+
+
+def run_turn_interruptible(session, user_input, emit):
+    """Run a turn on a worker thread so Ctrl-C cancels only the turn, not the REPL."""
+    outcome = {}
+
+    def target():
+        try:
+            run_turn(session, user_input, emit)
+        except Exception as err:
+            outcome["error"] = err
+
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    while worker.is_alive():
+        try:
+            worker.join(0.1)
+        except KeyboardInterrupt:
+            session.cancel()
+    if "error" in outcome:
+        raise outcome["error"]
 
 
 def separator():
@@ -586,15 +2166,237 @@ def configure_stdio():
             pass
 
 
+def print_event(event):
+    if event["type"] == "text":
+        print(f"\n{CYAN}⏺{RESET} {render_markdown(event['text'])}")
+    elif event["type"] == "tool_use":
+        arg_preview = str(next(iter(event["input"].values()), ""))[:50]
+        print(f"\n{GREEN}⏺ {event['name'].capitalize()}{RESET}({DIM}{arg_preview}{RESET})")
+    elif event["type"] == "tool_result":
+        result_lines = event["content"].split("\n")
+        preview = result_lines[0][:60]
+        if len(result_lines) > 1:
+            preview += f" ... +{len(result_lines) - 1} lines"
+        elif len(result_lines[0]) > 60:
+            preview += "..."
+        print(f"  {DIM}⎿  {preview}{RESET}")
+    elif event["type"] == "cancelled":
+        print(f"\n{YELLOW}⏺ Interrupted{RESET}")
+
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+class RPCHandler(http.server.BaseHTTPRequestHandler):
+    """JSON-RPC 2.0 over HTTP POST; session.send streams NDJSON events then the result."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def refusal(self):
+        """(status, message) when the request didn't come from a local client holding the token."""
+        if self.headers.get("Origin") is not None:
+            return 403, "browser requests are not allowed"
+        # a DNS-rebound page reaches 127.0.0.1 with its own name in Host
+        host = urllib.parse.urlsplit("//" + (self.headers.get("Host") or "")).hostname
+        if not isinstance(self.server, UnixRPCServer) and host not in LOCAL_HOSTS:
+            return 403, "Host must be localhost"
+        if (self.headers.get("Content-Type") or "").split(";")[0].strip() != "application/json":
+            return 415, "Content-Type must be application/json"
+        if not secrets.compare_digest(self.headers.get("Authorization") or "", f"Bearer {self.server.token}"):
+            return 401, "missing or wrong Authorization: Bearer token"
+        return None
+
+    def do_POST(self):
+        refused = self.refusal()
+        if refused:
+            self.close_connection = True
+            status, message = refused
+            return self.reply({"jsonrpc": "2.0", "id": None, "error": {"code": -32001, "message": message}}, status)
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            rpc_id, method, params = request.get("id"), request["method"], request.get("params") or {}
+        except Exception:
+            return self.reply({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "parse error"}})
+        if method == "session.send":
+            return self.stream(rpc_id, params)
+        handler = getattr(self, "rpc_" + method.replace(".", "_"), None)
+        if handler is None:
+            return self.reply({"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32601, "message": f"unknown method {method}"}})
+        try:
+            self.reply({"jsonrpc": "2.0", "id": rpc_id, "result": handler(params)})
+        except Exception as err:
+            self.reply({"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32000, "message": str(err)}})
+
+    def reply(self, message, status=200):
+        body = (json.dumps(message) + "\n").encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def session(self, params):
+        session = self.server.sessions.get(params.get("session"))
+        if session is None:
+            raise ValueError(f"unknown session {params.get('session')}")
+        return session
+
+    def stream(self, rpc_id, params):
+        try:
+            session = self.session(params)
+        except ValueError as err:
+            return self.reply({"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32602, "message": str(err)}})
+        if not session.lock.acquire(blocking=False):
+            return self.reply({"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32000, "message": "session is busy"}})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def emit(event):
+            try:
+                self.write_chunk({"jsonrpc": "2.0", "method": "event", "params": {"session": session.id, **event}})
+            except OSError:
+                # client went away: stop the turn instead of running it to completion
+                session.cancel()
+
+        # release the session before the final chunk, so a client may reuse it as soon as it reads the result
+        try:
+            run_turn(session, params["input"], emit)
+            final = {"jsonrpc": "2.0", "id": rpc_id, "result": {"session": session.id, "messages": len(session.messages)}}
+        except Exception as err:
+            final = {"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32000, "message": str(err)}}
+        finally:
+            session.lock.release()
+        try:
+            self.write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            self.close_connection = True
+
+    def rpc_session_create(self, params):
+        provider = select_provider(params["provider"]) if params.get("provider") else resolve_provider()
+        fast = select_provider(params["fast_provider"]) if params.get("fast_provider") else resolve_fast_provider()
+        session = Session(provider, fast)
+        self.server.sessions[session.id] = session
+        return {"session": session.id, "provider": provider["name"], "model": provider["model"]}
+
+    def rpc_session_cancel(self, params):
+        self.session(params).cancel()
+        return {"session": params["session"]}
+
+    def rpc_session_stats(self, params):
+        router = self.session(params).router
+        return {"stats": router.stats, "escalations": router.escalations, "summary": router.summary()}
+
+    def idle_session(self, params):
+        """Session with its lock held; raises if a turn is running. The caller releases the lock."""
+        session = self.session(params)
+        if not session.lock.acquire(blocking=False):
+            raise ValueError("session is busy")
+        return session
+
+    def rpc_session_clear(self, params):
+        session = self.idle_session(params)
+        try:
+            session.messages = History()
+        finally:
+            session.lock.release()
+        return {"session": params["session"]}
+
+    def rpc_session_fork(self, params):
+        parent = self.idle_session(params)
+        try:
+            session = parent.fork()
+        finally:
+            parent.lock.release()
+        self.server.sessions[session.id] = session
+        return {"session": session.id, "parent": parent.id, "messages": len(session.messages)}
+
+    def rpc_session_close(self, params):
+        session = self.session(params)
+        del self.server.sessions[params["session"]]
+        # the turn may not have started yet when we first cancel, so keep cancelling until it lets go
+        while not session.lock.acquire(timeout=0.1):
+            session.cancel()
+        session.lock.release()
+        # forks share their parent's jobs; stop them once no open session can see them
+        if not any(other.job_owner == session.job_owner for other in list(self.server.sessions.values())):
+            kill_jobs(session.job_owner)
+        return {"session": params["session"]}
+
+    def rpc_session_list(self, params):
+        return {"sessions": sorted(self.server.sessions)}
+
+
+class UnixRPCServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(address, token=None):
+    if address.startswith("unix:"):
+        path = address[len("unix:") :]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = UnixRPCServer(path, RPCHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)), RPCHandler)
+    server.sessions = {}
+    server.token = token or secrets.token_urlsafe(32)
+    return server
+
+
+def server_token_path(address):
+    return os.path.join(cache_dir(), "server-" + re.sub(r"[^\w.-]", "_", address) + ".token")
+
+
+def write_server_token(address, token):
+    path = server_token_path(address)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return path
+
+
+def serve(address):
+    global RENDER_OUTPUT
+    RENDER_OUTPUT = False
+    start_tool_pool()
+    server = make_server(address)
+    token_path = write_server_token(address, server.token)
+    print(f"{BOLD}nanocode{RESET} | {DIM}serving JSON-RPC on {address} | {os.getcwd()}{RESET}", file=sys.stderr)
+    print(f"{DIM}bearer token in {token_path}{RESET}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
 def main():
     configure_stdio()
-    global PROVIDER, API_URL, MODEL
-    PROVIDER = resolve_provider()
-    API_URL = PROVIDER["api_url"]
-    MODEL = PROVIDER["model"]
-    print(f"{BOLD}nanocode{RESET} | {DIM}{MODEL} ({PROVIDER['name']}) | {os.getcwd()}{RESET}\n")
-    messages = []
-    system_prompt = f"Concise coding assistant. cwd: {os.getcwd()}"
+    if sys.argv[1:2] == ["--serve"]:
+        return serve(sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1:8765")
+    session = Session(resolve_provider(), resolve_fast_provider())
+    sessions = [session]
+    start_tool_pool()
+    fast = session.router.fast
+    models = f"{session.provider['model']} ({session.provider['name']})"
+    if fast:
+        models += f" + fast {fast['model']} ({fast['name']})"
+    print(f"{BOLD}nanocode{RESET} | {DIM}{models} | {os.getcwd()}{RESET}\n")
 
     while True:
         try:
@@ -606,59 +2408,39 @@ def main():
             if user_input in ("/q", "exit"):
                 break
             if user_input == "/c":
-                messages = []
+                session.messages = History()
                 print(f"{GREEN}⏺ Cleared conversation{RESET}")
                 continue
+            if user_input == "/fork":
+                session = session.fork()
+                sessions.append(session)
+                print(f"{GREEN}⏺ Forked session {len(sessions) - 1} ({len(session.messages)} messages){RESET}")
+                continue
+            if user_input.startswith("/switch"):
+                target = user_input[len("/switch") :].strip()
+                if target.isdigit() and int(target) < len(sessions):
+                    session = sessions[int(target)]
+                    print(f"{GREEN}⏺ Switched to session {target} ({len(session.messages)} messages){RESET}")
+                    continue
+                for idx, candidate in enumerate(sessions):
+                    parent = next((n for n, other in enumerate(sessions) if other.id == candidate.parent), None)
+                    origin = f", forked from {parent}" if parent is not None else ""
+                    mark = "*" if candidate is session else " "
+                    print(f"{DIM}{mark} {idx}: {len(candidate.messages)} messages{origin}{RESET}")
+                continue
+            if user_input == "/stats":
+                print(f"{DIM}{session.router.summary()}{RESET}")
+                continue
 
-            messages.append({"role": "user", "content": user_input})
-
-            # agentic loop: keep calling API until no more tool calls
-            while True:
-                response = call_api(messages, system_prompt)
-                content_blocks = response.get("content", [])
-                tool_results = []
-
-                for block in content_blocks:
-                    if block["type"] == "text":
-                        print(f"\n{CYAN}⏺{RESET} {render_markdown(block['text'])}")
-
-                    if block["type"] == "tool_use":
-                        tool_name = block["name"]
-                        tool_args = block["input"]
-                        arg_preview = str(list(tool_args.values())[0])[:50]
-                        print(
-                            f"\n{GREEN}⏺ {tool_name.capitalize()}{RESET}({DIM}{arg_preview}{RESET})"
-                        )
-
-                        result = run_tool(tool_name, tool_args)
-                        result_lines = result.split("\n")
-                        preview = result_lines[0][:60]
-                        if len(result_lines) > 1:
-                            preview += f" ... +{len(result_lines) - 1} lines"
-                        elif len(result_lines[0]) > 60:
-                            preview += "..."
-                        print(f"  {DIM}⎿  {preview}{RESET}")
-
-                        tool_results.append(
-                            {
-                                "type": "tool_result",
-                                "tool_use_id": block["id"],
-                                "content": result,
-                            }
-                        )
-
-                messages.append({"role": "assistant", "content": content_blocks})
-
-                if not tool_results:
-                    break
-                messages.append({"role": "user", "content": tool_results})
-
+            run_turn_interruptible(session, user_input, print_event)
             print()
 
         except (KeyboardInterrupt, EOFError):
             break
         except Exception as err:
             print(f"{RED}⏺ Error: {err}{RESET}")
+    if session.router.fast:
+        print(f"{DIM}{session.router.summary()}{RESET}", file=sys.stderr)
 
 
 if __name__ == "__main__":
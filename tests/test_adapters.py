@@ -142,6 +142,13 @@ def test_parse_openai_response_text():
     assert parsed["content"] == [{"type": "text", "text": "Hi"}]
 
 
+def test_parse_responses_normalize_usage():
+    openai = {"choices": [{"message": {"content": "Hi"}}], "usage": {"prompt_tokens": 7, "completion_tokens": 2}}
+    ollama = {"message": {"content": "Hi"}, "prompt_eval_count": 5, "eval_count": 3}
+    assert parse_openai_response(openai)["usage"] == {"input_tokens": 7, "output_tokens": 2}
+    assert parse_ollama_response(ollama)["usage"] == {"input_tokens": 5, "output_tokens": 3}
+
+
 def test_parse_openai_response_tool_calls():
     response = {
         "choices": [
@@ -176,3 +183,5 @@ def test_parse_ollama_response():
     assert parsed["content"][0] == {"type": "text", "text": "Hello"}
     assert parsed["content"][1]["type"] == "tool_use"
     assert parsed["content"][1]["input"] == {"path": "y"}
+    assert parsed["content"][1]["id"].startswith("call_")
+    assert parsed["content"][1]["id"] != parse_ollama_response(response)["content"][1]["id"]
@@ -0,0 +1,86 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import History, MessageStore, RawJSON, StoredBlock, encode_messages, encode_payload, materialize
+from nanocode import messages_to_ollama, messages_to_openai
+from test_store import long_history
+
+
+def test_fork_shares_prefix_and_isolates_appends():
+    parent = History(long_history(3))
+    child = parent.fork()
+
+    child.append({"role": "user", "content": "child"})
+    parent.append({"role": "user", "content": "parent"})
+
+    assert len(parent) == len(child) == 8
+    assert child[-1]["content"] == "child" and parent[-1]["content"] == "parent"
+    assert child[6] is parent[6]
+    assert list(child)[:7] == list(parent)[:7]
+
+
+def test_encode_matches_full_conversion():
+    messages = long_history(3) + [{"role": "assistant", "content": [{"type": "text", "text": "done"}]}]
+    history = History(messages)
+
+    for _ in range(2):
+        assert json.loads(encode_messages(history, "openai", "sys")) == messages_to_openai(messages, "sys")
+        assert json.loads(encode_messages(history, "ollama", "sys")) == messages_to_ollama(messages, "sys")
+        assert encode_messages(history, "anthropic", "sys") == json.dumps(messages)
+
+
+def test_fork_reuses_parent_fragments(monkeypatch):
+    parent = History(long_history(5))
+    encode_messages(parent, "openai", "sys")
+    child = parent.fork()
+    child.append({"role": "user", "content": "next"})
+
+    calls = []
+    wire = nanocode._wire_messages
+    monkeypatch.setattr(nanocode, "_wire_messages", lambda *args: calls.append(args) or wire(*args))
+    encode_messages(child, "openai", "sys")
+
+    assert [args[1]["content"] for args in calls] == ["next"]
+
+
+def test_stored_blocks_are_not_cached():
+    messages = long_history(3)
+    history = History(messages)
+    expected = encode_messages(history, "anthropic", "sys")
+
+    MessageStore(cap=0, keep_recent=0).compact(history)
+
+    assert encode_messages(history, "anthropic", "sys") == expected
+    nodes = [node for node in history.nodes() if isinstance(node.message["content"], list)]
+    stored = [node for node in nodes if any(isinstance(block, StoredBlock) for block in node.message["content"])]
+    assert stored and all(not node.fragments for node in stored)
+    assert json.dumps(materialize(history)) == expected
+
+
+def test_encode_payload_splices_raw_json():
+    body = encode_payload({"model": "m", "messages": RawJSON('[{"role": "user"}]'), "stream": False})
+
+    assert json.loads(body) == {"model": "m", "stream": False, "messages": [{"role": "user"}]}
+
+
+def test_compact_counts_cached_fragments():
+    history = History(long_history(10))
+    encode_messages(history, "anthropic", "sys")
+    encode_messages(history, "ollama", "sys")
+    bodies = 10 * 2000
+
+    resident = MessageStore(cap=bodies, keep_recent=4).compact(history)
+
+    fragments = sum(len(fragment) for node in history.nodes() for fragment in node.fragments.values())
+    assert resident <= bodies
+    assert resident == fragments + sum(
+        len(block["content"])
+        for message in history
+        if isinstance(message["content"], list)
+        for block in message["content"]
+        if block["type"] == "tool_result" and not isinstance(block, StoredBlock)
+    )
@@ -0,0 +1,112 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import CodeIndex, find_relevant, tokenize
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(nanocode, "INDEXES", {})
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "auth.py").write_text("def validate_token(token):\n    return check_signature(token)\n")
+    (root / "billing.py").write_text("class InvoiceRenderer:\n    def render_pdf(self):\n        pass\n")
+    (root / "notes.md").write_text("Deployment checklist\n")
+    return root
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("parseHTTPResponse max_tokens") == [
+        "parsehttpresponse",
+        "parse",
+        "http",
+        "response",
+        "max_tokens",
+        "max",
+        "tokens",
+    ]
+
+
+def test_search_ranks_identifier_matches(workspace):
+    results = CodeIndex(str(workspace)).search("how do we validate a token signature", k=3)
+
+    assert results[0][1:] == ("auth.py", 0, 2)
+    assert CodeIndex(str(workspace)).search("invoice pdf")[0][1] == "billing.py"
+
+
+def test_index_updates_incrementally_and_persists(workspace):
+    index = CodeIndex(str(workspace))
+    index.search("token")
+    assert os.path.exists(index.path)
+
+    (workspace / "auth.py").unlink()
+    (workspace / "session.py").write_text("def refresh_token():\n    pass\n")
+    index.invalidate()
+    assert [rel for _score, rel, *_span in index.search("token")] == ["session.py"]
+
+    reloaded = CodeIndex(str(workspace))
+    assert set(reloaded.files) == {"billing.py", "notes.md", "session.py"}
+
+
+def test_find_relevant_tool_output(workspace):
+    result = find_relevant({"query": "InvoiceRenderer", "path": str(workspace), "k": 1})
+
+    lines = result.split("\n")
+    assert lines[0].startswith(f"{workspace}/billing.py:1-3 (score ")
+    assert lines[1] == "   1| class InvoiceRenderer:"
+    assert find_relevant({"query": "zzz", "path": str(workspace)}) == "none"
+
+
+def test_update_rereads_only_changed_files_and_appends(workspace, monkeypatch):
+    index = CodeIndex(str(workspace))
+    index.search("token")
+    with open(index.path) as f:
+        header = f.readline()
+
+    reads = []
+    chunks = CodeIndex.chunks
+    monkeypatch.setattr(CodeIndex, "chunks", lambda self, path, rel: reads.append(rel) or chunks(self, path, rel))
+    (workspace / "auth.py").write_text("def revoke_session():\n    pass\n")
+    index.invalidate()
+    assert index.search("token") == []
+    assert reads == ["auth.py"]
+    assert "token" not in index.postings
+
+    with open(index.path) as f:
+        assert f.readline() == header
+        assert len(f.readlines()) == 4
+    reloaded = CodeIndex(str(workspace))
+    assert reloaded.search("revoke")[0][1] == "auth.py"
+    assert reloaded.postings.keys() == index.postings.keys()
+
+
+def test_own_edits_are_seen_without_a_full_rescan(workspace, monkeypatch):
+    monkeypatch.setattr(nanocode, "INDEX_RESCAN_SECONDS", 3600)
+    walks = []
+    walk_files = nanocode.walk_files
+    monkeypatch.setattr(nanocode, "walk_files", lambda root: walks.append(root) or walk_files(root))
+    path = str(workspace)
+    find_relevant({"query": "token", "path": path})
+
+    nanocode.run_tool("edit", {"path": str(workspace / "notes.md"), "old": "Deployment", "new": "Rollback"})
+    assert find_relevant({"query": "rollback", "path": path}).startswith(f"{workspace}/notes.md:1-1")
+    assert len(walks) == 1
+
+    nanocode.run_tool("write", {"path": str(workspace / "new.py"), "content": "ROLLBACK = 1\n"})
+    assert "new.py" in find_relevant({"query": "rollback", "path": path})
+    assert len(walks) == 2
+
+
+def test_empty_files_have_no_chunks(workspace):
+    (workspace / "empty_token.py").write_text("")
+
+    result = find_relevant({"query": "empty token", "path": str(workspace)})
+    assert "empty_token.py" not in result
+    assert ":1-0" not in result
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import ToolPool, run_tool
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="tool workers need POSIX")
+
+
+@pytest.fixture
+def pool():
+    pool = ToolPool(1, memory_mb=512, max_tasks=3)
+    yield pool
+    pool.close()
+
+
+def worker_pid(pool):
+    return pool.idle.queue[0].process.pid
+
+
+def test_pool_runs_tools_in_worker(pool, tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("hello\n")
+
+    assert pool.run("read", {"path": str(source)}) == "   1| hello\n"
+    assert worker_pid(pool) != os.getpid()
+    assert pool.run("read", {"path": str(tmp_path / "missing")}).startswith("error: [Errno 2]")
+
+
+def test_pool_times_out_and_replaces_worker(pool, tmp_path):
+    source = tmp_path / "evil.txt"
+    source.write_text("a" * 40 + "b\n")
+    before = worker_pid(pool)
+
+    started = time.monotonic()
+    result = pool.run("grep", {"pat": "(a+)+$", "path": str(source)}, timeout=0.5)
+
+    assert result == "error: grep timed out after 0.5s"
+    assert time.monotonic() - started < 5
+    assert worker_pid(pool) != before
+    assert pool.run("read", {"path": str(source)}).startswith("   1| aaaa")
+
+
+def test_pool_recycles_after_max_tasks(pool, tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("x\n")
+    first = worker_pid(pool)
+
+    for _ in range(3):
+        pool.run("read", {"path": str(source)})
+
+    assert worker_pid(pool) != first
+
+
+def test_pool_survives_worker_crash(pool):
+    pool.idle.queue[0].process.kill()
+    time.sleep(0.1)
+
+    assert pool.run("glob", {"pat": "*.none"}).startswith("error: glob worker crashed")
+    assert pool.run("glob", {"pat": "*.none"}) == "none"
+
+
+def test_run_tool_uses_pool_for_heavy_tools(pool, monkeypatch, tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("x\n")
+    monkeypatch.setattr(nanocode, "TOOL_POOL", pool)
+    monkeypatch.setitem(nanocode.TOOLS, "read", ("", {}, lambda args: "in-process"))
+
+    assert run_tool("read", {"path": str(source)}) == "   1| x\n"
+
+
+
+def test_queued_call_counts_wait_and_honours_cancel(pool):
+    worker = pool.idle.get()
+    try:
+        assert pool.run("glob", {"pat": "*.none"}, timeout=0.2) == "error: glob timed out after 0.2s waiting for a tool worker"
+
+        nanocode.TURN.turn = turn = nanocode.Turn()
+        turn.cancel()
+        with pytest.raises(nanocode.TurnCancelled):
+            pool.run("glob", {"pat": "*.none"})
+    finally:
+        nanocode.TURN.turn = None
+        pool.idle.put(worker)
+
+
+def test_failed_respawn_is_retried_then_falls_back_in_process(pool, monkeypatch):
+    real_worker = nanocode.ToolWorker
+
+    def broken(*args):
+        raise OSError("fork failed")
+
+    monkeypatch.setattr(nanocode, "ToolWorker", broken)
+    pool.idle.queue[0].process.kill()
+    time.sleep(0.1)
+    assert pool.run("glob", {"pat": "*.none"}).startswith("error: glob worker crashed")
+    assert pool.missing == 1
+    assert pool.run("glob", {"pat": "*.none"}) == "none"
+
+    monkeypatch.setattr(nanocode, "ToolWorker", real_worker)
+    assert pool.run("glob", {"pat": "*.none"}) == "none"
+    assert pool.missing == 0
+    assert worker_pid(pool) != os.getpid()
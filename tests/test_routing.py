@@ -0,0 +1,126 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import Router
+
+PRIMARY = {"name": "Anthropic", "kind": "anthropic", "model": "big"}
+FAST = {"name": "Ollama", "kind": "ollama", "model": "small"}
+
+
+def step(name, content="data", tool_id="call-1"):
+    return [
+        {"role": "user", "content": "task"},
+        {"role": "assistant", "content": [{"type": "tool_use", "id": tool_id, "name": name, "input": {}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": tool_id, "content": content}]},
+    ]
+
+
+def tool_reply(usage=10):
+    return {
+        "content": [{"type": "tool_use", "id": "next", "name": "read", "input": {"path": "x"}}],
+        "usage": {"input_tokens": usage, "output_tokens": 1},
+    }
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+
+    def fake_call_api(messages, system_prompt, provider):
+        seen.append(provider["model"])
+        return tool_reply()
+
+    monkeypatch.setattr(nanocode, "call_api", fake_call_api)
+    return seen
+
+
+def test_choose_policy():
+    router = Router(PRIMARY, FAST)
+
+    assert router.choose([{"role": "user", "content": "task"}]) == "primary"
+    assert router.choose(step("read")) == "fast"
+    assert router.choose(step("grep")) == "fast"
+    assert router.choose(step("edit")) == "primary"
+    assert router.choose(step("read", content="error: missing")) == "primary"
+    assert Router(PRIMARY).choose(step("read")) == "primary"
+
+
+def test_call_routes_and_records_stats(calls):
+    router = Router(PRIMARY, FAST)
+
+    assert router.call(step("read"), "system")[1] == "fast"
+    assert router.call(step("bash"), "system")[1] == "primary"
+    assert router.call(step("read"), "system", escalated=True)[1] == "primary"
+
+    assert calls == ["small", "big", "big"]
+    assert router.stats["fast"]["calls"] == 1
+    assert router.stats["fast"]["input_tokens"] == 10
+    assert router.stats["primary"]["calls"] == 2
+    assert "11 tokens kept off the primary, 0 escalations (0 fast tokens wasted)" in router.summary()
+
+
+def test_fast_failure_escalates(monkeypatch):
+    seen = []
+
+    def fake_call_api(messages, system_prompt, provider):
+        seen.append(provider["model"])
+        if provider is FAST:
+            raise OSError("connection refused")
+        return tool_reply()
+
+    monkeypatch.setattr(nanocode, "call_api", fake_call_api)
+    router = Router(PRIMARY, FAST)
+
+    assert router.call(step("read"), "system")[1] == "escalated"
+    assert seen == ["small", "big"]
+    assert router.escalations == 1
+
+
+def test_fast_final_answer_is_kept(monkeypatch):
+    replies = {"small": {"content": [{"type": "text", "text": "done"}]}, "big": tool_reply()}
+    monkeypatch.setattr(nanocode, "call_api", lambda messages, system, provider: replies[provider["model"]])
+    router = Router(PRIMARY, FAST)
+
+    response, role = router.call(step("read"), "system")
+
+    assert role == "fast"
+    assert response is replies["small"]
+
+
+def test_fast_empty_reply_escalates(monkeypatch):
+    replies = {"small": {"content": [{"type": "text", "text": " "}]}, "big": tool_reply()}
+    monkeypatch.setattr(nanocode, "call_api", lambda messages, system, provider: replies[provider["model"]])
+
+    assert Router(PRIMARY, FAST).call(step("read"), "system") == (replies["big"], "escalated")
+
+
+def test_fast_mutating_tool_escalates(monkeypatch):
+    edit = {"content": [{"type": "tool_use", "id": "e", "name": "edit", "input": {}}]}
+    edit["usage"] = {"input_tokens": 30, "output_tokens": 5}
+    replies = {"small": edit, "big": tool_reply()}
+    monkeypatch.setattr(nanocode, "call_api", lambda messages, system, provider: replies[provider["model"]])
+    router = Router(PRIMARY, FAST)
+
+    assert router.call(step("read"), "system")[1] == "escalated"
+    assert "0 tokens kept off the primary, 1 escalations (35 fast tokens wasted)" in router.summary()
+
+
+def test_fast_reply_repeated_ids_are_replaced(monkeypatch):
+    reply = {
+        "content": [
+            {"type": "tool_use", "id": "read", "name": "read", "input": {"path": "a"}},
+            {"type": "tool_use", "id": "read", "name": "read", "input": {"path": "b"}},
+        ]
+    }
+    monkeypatch.setattr(nanocode, "call_api", lambda messages, system, provider: reply)
+
+    response, role = Router(PRIMARY, FAST).call(step("read", tool_id="read"), "system")
+
+    ids = [block["id"] for block in response["content"]]
+    assert role == "fast"
+    assert "read" not in ids and len(set(ids)) == 2
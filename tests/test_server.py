@@ -0,0 +1,208 @@
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import make_server
+
+
+class FakeOpenAI(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        FakeOpenAI.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if payload["messages"][-1]["role"] == "tool":
+            message = {"content": "done: " + payload["messages"][-1]["content"]}
+        else:
+            message = {
+                "tool_calls": [
+                    {
+                        "id": "call-1",
+                        "function": {"name": "bash", "arguments": json.dumps({"cmd": "echo hi"})},
+                    }
+                ]
+            }
+        body = json.dumps({"choices": [{"message": message}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start(server):
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    llm = start(http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI))
+    monkeypatch.setenv("NANOCODE_PROVIDER", "vllm")
+    monkeypatch.setenv("VLLM_API_URL", f"http://127.0.0.1:{llm.server_address[1]}")
+    monkeypatch.setenv("VLLM_MODEL", "fake")
+    monkeypatch.setattr(nanocode, "RENDER_OUTPUT", False)
+    monkeypatch.setattr(nanocode, "HTTP_POOL", nanocode.ConnectionPool())
+    FakeOpenAI.connections = 0
+    server = start(make_server("127.0.0.1:0"))
+
+    def call(method, **params):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}",
+            data=json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params}).encode(),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {server.token}"},
+        )
+        return [json.loads(line) for line in urllib.request.urlopen(request, timeout=10)]
+
+    call.server = server
+    yield call
+    server.shutdown()
+    llm.shutdown()
+
+
+def test_session_send_streams_events(rpc):
+    session = rpc("session.create")[0]["result"]["session"]
+
+    messages = rpc("session.send", session=session, input="say hi")
+
+    events = [message["params"] for message in messages if message.get("method") == "event"]
+    assert [event["type"] for event in events] == ["tool_use", "tool_result", "text"]
+    assert events[1]["content"] == "hi"
+    assert events[2]["text"] == "done: hi"
+    assert messages[-1]["result"] == {"session": session, "messages": 4}
+
+
+def test_sessions_are_independent_and_share_connections(rpc):
+    first = rpc("session.create")[0]["result"]["session"]
+    second = rpc("session.create")[0]["result"]["session"]
+
+    rpc("session.send", session=first, input="one")
+    rpc("session.send", session=second, input="two")
+    rpc("session.clear", session=first)
+
+    assert sorted(rpc("session.list")[0]["result"]["sessions"]) == sorted([first, second])
+    assert FakeOpenAI.connections == 1
+    assert rpc("session.close", session=first)[0]["result"] == {"session": first}
+    assert rpc("session.send", session=first, input="x")[0]["error"]["code"] == -32602
+
+
+@pytest.mark.parametrize(
+    "headers, status",
+    [
+        ({"Authorization": None}, 401),
+        ({"Authorization": "Bearer wrong"}, 401),
+        ({"Origin": "http://evil.example"}, 403),
+        ({"Host": "evil.example:8765"}, 403),
+        ({"Content-Type": "text/plain"}, 415),
+    ],
+)
+def test_rejects_untrusted_requests(rpc, headers, status):
+    server = rpc.server
+    base = {"Content-Type": "application/json", "Authorization": f"Bearer {server.token}"}
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.server_address[1]}",
+        data=json.dumps({"jsonrpc": "2.0", "id": 1, "method": "session.list"}).encode(),
+        headers={key: value for key, value in {**base, **headers}.items() if value is not None},
+    )
+    with pytest.raises(urllib.error.HTTPError) as err:
+        urllib.request.urlopen(request, timeout=10)
+    assert err.value.code == status
+    assert not server.sessions
+
+
+def test_token_file_is_private(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    path = nanocode.write_server_token("127.0.0.1:8765", "secret")
+
+    assert open(path).read() == "secret"
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_unknown_method(rpc):
+    assert rpc("nope")[0]["error"]["code"] == -32601
+
+
+def test_fork_continues_from_parent_history(rpc):
+    parent = rpc("session.create")[0]["result"]["session"]
+    rpc("session.send", session=parent, input="one")
+
+    fork = rpc("session.fork", session=parent)[0]["result"]
+    assert fork["parent"] == parent and fork["messages"] == 4
+
+    assert rpc("session.send", session=fork["session"], input="two")[-1]["result"]["messages"] == 8
+    assert rpc("session.send", session=parent, input="three")[-1]["result"]["messages"] == 8
+
+
+def test_clear_refuses_busy_session_and_close_cancels_turn(rpc, monkeypatch):
+    started = threading.Event()
+
+    def slow_call_api(*args):
+        started.set()
+        nanocode.current_turn().cancelled.wait(10)
+        return {"content": [{"type": "text", "text": "late"}]}
+
+    monkeypatch.setattr(nanocode, "call_api", slow_call_api)
+    session = rpc("session.create")[0]["result"]["session"]
+    replies = []
+    sender = threading.Thread(target=lambda: replies.extend(rpc("session.send", session=session, input="slow")))
+    sender.start()
+    assert started.wait(5)
+
+    assert rpc("session.clear", session=session)[0]["error"]["message"] == "session is busy"
+    assert rpc("session.close", session=session)[0]["result"] == {"session": session}
+    sender.join(5)
+    assert [reply["params"]["type"] for reply in replies if reply.get("method") == "event"] == ["cancelled"]
+
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        SlowHandler.requests += 1
+        if self.path == "/slow":
+            time.sleep(1)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+        except OSError:
+            pass
+
+
+def test_pool_does_not_repost_after_timeout():
+    server = start(http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler))
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    pool = nanocode.ConnectionPool()
+    SlowHandler.requests = 0
+    try:
+        assert pool.post(url + "/fast", b"{}", {}) == b"ok"
+        with pytest.raises(TimeoutError):
+            pool.post(url + "/slow", b"{}", {}, timeout=0.3)
+        assert SlowHandler.requests == 2
+    finally:
+        server.shutdown()
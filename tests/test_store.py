@@ -0,0 +1,69 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from nanocode import MessageStore, StoredBlock, materialize, messages_to_ollama, messages_to_openai
+
+
+def long_history(turns, size=2000):
+    messages = [{"role": "user", "content": "start"}]
+    for idx in range(turns):
+        messages.append(
+            {
+                "role": "assistant",
+                "content": [{"type": "tool_use", "id": f"call-{idx}", "name": "read", "input": {"path": f"f{idx}"}}],
+            }
+        )
+        messages.append(
+            {
+                "role": "user",
+                "content": [{"type": "tool_result", "tool_use_id": f"call-{idx}", "content": f"{idx}" * size}],
+            }
+        )
+    return messages
+
+
+def stored(messages):
+    return [
+        block["tool_use_id"]
+        for message in messages
+        if isinstance(message["content"], list)
+        for block in message["content"]
+        if isinstance(block, StoredBlock)
+    ]
+
+
+def test_compact_offloads_oldest_bodies_until_under_cap():
+    messages = long_history(10)
+    store = MessageStore(cap=9000, keep_recent=4)
+
+    resident = store.compact(messages)
+
+    assert resident <= 9000
+    assert stored(messages) == [f"call-{idx}" for idx in range(6)]
+    assert store.compact(messages) == resident
+
+
+def test_compact_keeps_recent_messages_resident():
+    messages = long_history(3)
+    store = MessageStore(cap=0, keep_recent=4)
+
+    store.compact(messages)
+
+    assert stored(messages) == ["call-0"]
+
+
+def test_adapters_load_stored_bodies():
+    messages = long_history(5)
+    expected_openai = messages_to_openai(messages, "system")
+    expected_ollama = messages_to_ollama(messages, "system")
+    expected_json = json.dumps(messages)
+
+    MessageStore(cap=0, keep_recent=0).compact(messages)
+
+    assert len(stored(messages)) == 5
+    assert messages_to_openai(messages, "system") == expected_openai
+    assert messages_to_ollama(messages, "system") == expected_ollama
+    assert json.dumps(materialize(messages)) == expected_json
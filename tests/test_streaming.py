@@ -0,0 +1,131 @@
+import http.server
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import Session, run_turn
+
+
+def anthropic_tool_use(index, name, args):
+    encoded = json.dumps(args)
+    block = {"type": "tool_use", "id": f"t{index}", "name": name, "input": {}}
+    return [
+        {"type": "content_block_start", "index": index, "content_block": block},
+        {"type": "content_block_delta", "index": index, "delta": {"type": "input_json_delta", "partial_json": encoded[:5]}},
+        {"type": "content_block_delta", "index": index, "delta": {"type": "input_json_delta", "partial_json": encoded[5:]}},
+        {"type": "content_block_stop", "index": index},
+    ]
+
+
+def anthropic_events(step):
+    if step > 0:
+        return [
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+            {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "done"}},
+            {"type": "content_block_stop", "index": 0},
+        ]
+    return [
+        {"type": "message_start", "message": {"usage": {"input_tokens": 9}}},
+        *anthropic_tool_use(0, "read", {"path": "a"}),
+        "PAUSE",
+        *anthropic_tool_use(1, "edit", {"path": "a"}),
+        *anthropic_tool_use(2, "read", {"path": "b"}),
+        {"type": "message_delta", "delta": {"stop_reason": "tool_use"}, "usage": {"output_tokens": 3}},
+    ]
+
+
+def openai_call(index, name=None, arguments=""):
+    call = {"index": index, "function": {"arguments": arguments}}
+    if name:
+        call.update(id=f"t{index}", function={"name": name, "arguments": arguments})
+    return {"choices": [{"delta": {"tool_calls": [call]}}]}
+
+
+def openai_events(step):
+    if step > 0:
+        return [{"choices": [{"delta": {"content": "done"}, "finish_reason": "stop"}]}]
+    return [
+        openai_call(0, "read", '{"pat'),
+        openai_call(0, arguments='h": "a"}'),
+        # the first call is only known to be complete once the next one starts
+        openai_call(1, "edit", '{"pat'),
+        "PAUSE",
+        openai_call(1, arguments='h": "a"}'),
+        openai_call(2, "read", '{"path": "b"}'),
+        {"choices": [{"delta": {}, "finish_reason": "tool_calls"}]},
+        {"choices": [], "usage": {"prompt_tokens": 9, "completion_tokens": 3}},
+    ]
+
+
+class FakeStream(http.server.BaseHTTPRequestHandler):
+    events = None
+    steps = 0
+    spec_started = threading.Event()
+    speculated = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        assert payload["stream"] is True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for event in FakeStream.events(FakeStream.steps):
+            if event == "PAUSE":
+                FakeStream.speculated = FakeStream.spec_started.wait(5)
+                continue
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        FakeStream.steps += 1
+
+
+@pytest.mark.parametrize("kind,events", [("anthropic", anthropic_events), ("openai", openai_events)])
+def test_read_only_tools_start_before_stream_ends(monkeypatch, kind, events):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeStream)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    FakeStream.events, FakeStream.steps, FakeStream.speculated = events, 0, None
+    FakeStream.spec_started = threading.Event()
+    calls = []
+
+    def fake_read(args):
+        calls.append((args["path"], FakeStream.steps))
+        FakeStream.spec_started.set()
+        return f"contents of {args['path']}"
+
+    def fake_edit(args):
+        calls.append(("edit", FakeStream.steps))
+        return "ok"
+
+    monkeypatch.setattr(nanocode, "STREAM_RESPONSES", True)
+    monkeypatch.setitem(nanocode.TOOLS, "read", ("", {}, fake_read))
+    monkeypatch.setitem(nanocode.TOOLS, "edit", ("", {}, fake_edit))
+    provider = {
+        "name": kind,
+        "kind": kind,
+        "api_url": f"http://127.0.0.1:{server.server_address[1]}/v1",
+        "model": "m",
+        "headers": {},
+        "extra": {},
+    }
+    session = Session(provider)
+    emitted = []
+
+    run_turn(session, "go", emitted.append)
+    server.shutdown()
+
+    assert FakeStream.speculated is True
+    # the first read ran mid-stream; the edit and the read after it waited for the response
+    assert calls == [("a", 0), ("edit", 1), ("b", 1)]
+    results = session.messages[2]["content"]
+    assert [result["content"] for result in results] == ["contents of a", "ok", "contents of b"]
+    assert [event["type"] for event in emitted] == ["tool_use", "tool_result"] * 3 + ["text"]
+    assert emitted[-1]["text"] == "done"
@@ -0,0 +1,342 @@
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import (
+    OutputBuffer,
+    bash,
+    grep,
+    job_kill,
+    job_output,
+    job_status,
+    make_schema,
+    read,
+    read_many,
+    run_tool,
+    walk_files,
+)
+
+
+def test_read_many_combines_sections(tmp_path):
+    first = tmp_path / "a.txt"
+    second = tmp_path / "b.txt"
+    first.write_text("one\ntwo\nthree\n")
+    second.write_text("alpha\nbeta\n")
+
+    result = read_many(
+        {"files": [{"path": str(first), "offset": 1, "limit": 1}, str(second)]}
+    )
+
+    assert result == (
+        f"==> {first} <==\n"
+        + read({"path": str(first), "offset": 1, "limit": 1})
+        + f"\n\n==> {second} <==\n"
+        + read({"path": str(second)})
+    )
+
+
+def test_read_many_reports_errors_per_file(tmp_path):
+    present = tmp_path / "present.txt"
+    present.write_text("ok\n")
+
+    result = read_many({"files": [{"path": str(tmp_path / "missing.txt")}, {"path": str(present)}]})
+
+    assert "error:" in result.split("\n\n")[0]
+    assert "   1| ok" in result
+
+
+def test_read_many_applies_budget(tmp_path):
+    big = tmp_path / "big.txt"
+    small = tmp_path / "small.txt"
+    big.write_text("x" * 200 + "\n")
+    small.write_text("y\n")
+
+    result = read_many({"files": [str(big), str(small)], "budget": 50})
+
+    assert "(truncated: output budget exhausted)" in result
+    assert f"==> {small} <==\n(skipped: output budget exhausted)" in result
+
+
+def test_read_many_schema_declares_array():
+    schema = next(tool for tool in make_schema() if tool["name"] == "read_many")
+    files = schema["input_schema"]["properties"]["files"]
+    assert files == {"type": "array", "items": {"type": "object"}}
+    assert schema["input_schema"]["required"] == ["files"]
+
+
+def test_run_tool_spills_oversized_output(monkeypatch):
+    monkeypatch.setattr(nanocode, "SPILL_THRESHOLD", 1000)
+    monkeypatch.setattr(nanocode, "SPILL_EXCERPT", 200)
+    text = "".join(f"line {idx}\n" for idx in range(500))
+    monkeypatch.setitem(nanocode.TOOLS, "dump", ("", {}, lambda args: text))
+
+    result = run_tool("dump", {})
+
+    assert len(result) < 1000
+    assert result.startswith("line 0\n")
+    assert result.endswith("line 499\n")
+    assert "(500 lines," in result
+    spilled = re.search(r"full output saved to (\S+),", result).group(1)
+    assert read({"path": spilled, "offset": 499, "limit": 1}) == " 500| line 499\n"
+
+
+def test_oversized_read_points_back_at_the_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(nanocode, "SPILL_THRESHOLD", 1000)
+    monkeypatch.setattr(nanocode, "SPILL_EXCERPT", 200)
+    source = tmp_path / "long.txt"
+    source.write_text("".join(f"line {idx}\n" for idx in range(500)))
+
+    result = run_tool("read", {"path": str(source)})
+
+    assert result.startswith("   1| line 0\n")
+    assert result.endswith(" 500| line 499\n")
+    assert re.search(r"\(500 lines, \d+ chars; page through the file with read using offset/limit\)", result)
+    assert "saved to" not in result
+
+
+def test_run_tool_keeps_small_output_inline(tmp_path):
+    source = tmp_path / "short.txt"
+    source.write_text("hello\n")
+    assert run_tool("read", {"path": str(source)}) == "   1| hello\n"
+
+
+def make_tree(root):
+    (root / "src").mkdir()
+    (root / "src" / "app.py").write_text("import os\nneedle = 1\nprint(needle)\n")
+    (root / "src" / "notes.md").write_text("needle in docs\n")
+    (root / "build").mkdir()
+    (root / "build" / "out.py").write_text("needle = 2\n")
+    (root / "node_modules").mkdir()
+    (root / "node_modules" / "dep.js").write_text("needle\n")
+    (root / ".git").mkdir()
+    (root / ".git" / "HEAD").write_text("needle\n")
+    (root / "blob.bin").write_bytes(b"needle\0\x01\x02")
+    (root / "debug.log").write_text("needle\n")
+    (root / "keep.log").write_text("needle\n")
+    (root / ".gitignore").write_text("# build output\nbuild/\n*.log\n!keep.log\n")
+
+
+def test_walk_files_honors_gitignore_and_skip_dirs(tmp_path):
+    make_tree(tmp_path)
+    root = str(tmp_path)
+
+    files = [path[len(root) + 1 :] for path in walk_files(root)]
+
+    assert sorted(files) == [".gitignore", "blob.bin", "keep.log", "src/app.py", "src/notes.md"]
+
+
+def test_walk_files_include_exclude(tmp_path):
+    make_tree(tmp_path)
+    root = str(tmp_path)
+
+    assert [p[len(root) + 1 :] for p in walk_files(root, include="*.py")] == ["src/app.py"]
+    assert "src/notes.md" not in [p[len(root) + 1 :] for p in walk_files(root, exclude="*.md")]
+
+
+def test_grep_skips_binary_and_ignored_files(tmp_path):
+    make_tree(tmp_path)
+    root = str(tmp_path)
+
+    result = grep({"pat": "needle", "path": root})
+
+    assert result.split("\n") == [
+        f"{root}/keep.log:1:needle",
+        f"{root}/src/app.py:2:needle = 1",
+        f"{root}/src/app.py:3:print(needle)",
+        f"{root}/src/notes.md:1:needle in docs",
+    ]
+
+
+def test_grep_context_lines(tmp_path):
+    source = tmp_path / "ctx.txt"
+    source.write_text("a\nb\nhit\nc\nd\ne\nf\nhit\ng\n")
+
+    result = grep({"pat": "hit", "path": str(source), "context": 1})
+
+    assert result.split("\n") == [
+        f"{source}-2-b",
+        f"{source}:3:hit",
+        f"{source}-4-c",
+        "--",
+        f"{source}-7-f",
+        f"{source}:8:hit",
+        f"{source}-9-g",
+    ]
+
+
+def test_grep_streams_large_files_with_same_output(tmp_path, monkeypatch):
+    source = tmp_path / "ctx.txt"
+    source.write_text("a\nb\nhit\nc\nd\ne\nf\nhit\ng\n")
+    expected = grep({"pat": "hit", "path": str(source), "context": 1})
+
+    monkeypatch.setattr(nanocode, "GREP_WHOLE_FILE_BYTES", 4)
+
+    assert grep({"pat": "hit", "path": str(source), "context": 1}) == expected
+
+
+def test_grep_line_numbers_match_read(tmp_path):
+    source = tmp_path / "ff.py"
+    source.write_bytes(b"one\ntwo\x0cpage\r\nthree = 1\n")
+
+    assert grep({"pat": "three", "path": str(source)}) == f"{source}:3:three = 1"
+    assert "   3| three = 1" in read({"path": str(source)})
+
+
+def test_grep_anchored_pattern_matches_each_line(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_text("x\nfoo\n")
+
+    assert grep({"pat": r"\Afoo", "path": str(source)}) == f"{source}:2:foo"
+
+
+def test_grep_stops_at_hit_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(nanocode, "GREP_MAX_HITS", 5)
+    for idx in range(20):
+        (tmp_path / f"f{idx:02}.txt").write_text("hit\nhit\n")
+
+    result = grep({"pat": "hit", "path": str(tmp_path)})
+
+    assert result.split("\n") == [
+        f"{tmp_path}/f00.txt:1:hit",
+        f"{tmp_path}/f00.txt:2:hit",
+        f"{tmp_path}/f01.txt:1:hit",
+        f"{tmp_path}/f01.txt:2:hit",
+        f"{tmp_path}/f02.txt:1:hit",
+    ]
+
+
+def test_output_buffer_keeps_head_and_tail():
+    buffer = OutputBuffer("test", head=2, tail=2)
+    buffer.feed("".join(f"{idx}\n" for idx in range(10)))
+    buffer.feed("partial")
+    buffer.close()
+
+    assert buffer.lines == 11
+    assert buffer.render() == "0\n1\n... (7 lines elided) ...\n9\npartial"
+
+
+def test_output_buffer_spills_full_stream(monkeypatch):
+    monkeypatch.setattr(nanocode, "SPILL_THRESHOLD", 100)
+    buffer = OutputBuffer("test", head=1, tail=1)
+    for idx in range(50):
+        buffer.feed(f"line {idx}\n")
+    buffer.close()
+
+    assert "48 lines elided; full output (50 lines) saved to" in buffer.render()
+    assert open(buffer.spill_path).read() == "".join(f"line {idx}\n" for idx in range(50))
+
+
+def test_bash_reports_elided_lines(monkeypatch, capsys):
+    monkeypatch.setattr(nanocode, "BASH_HEAD_LINES", 3)
+    monkeypatch.setattr(nanocode, "BASH_TAIL_LINES", 3)
+    command = f'"{sys.executable}" -c "for i in range(1000): print(i)"'
+
+    result = bash({"cmd": command})
+
+    assert result.split("\n") == ["0", "1", "2", "... (994 lines elided) ...", "997", "998", "999"]
+    assert "999" in capsys.readouterr().out
+
+
+def test_bash_keeps_long_lines_below_spill_threshold(monkeypatch):
+    monkeypatch.setattr(nanocode, "RENDER_OUTPUT", False)
+    command = f'"{sys.executable}" -c "print(\'x\' * 5000)"'
+
+    assert bash({"cmd": command}) == "x" * 5000
+
+    monkeypatch.setattr(nanocode, "SPILL_THRESHOLD", 1000)
+    head, marker = bash({"cmd": command}).split("\n")
+    assert head.startswith("x" * 500) and head.endswith("…") and len(head) < 1000
+    assert "1 long lines truncated; full output (1 lines) saved to" in marker
+    assert open(marker.split("saved to ")[1].split(",")[0]).read() == "x" * 5000 + "\n"
+
+
+def test_bash_excerpt_keeps_spill_marker(monkeypatch):
+    monkeypatch.setattr(nanocode, "RENDER_OUTPUT", False)
+    command = f'"{sys.executable}" -c "[print(i, \'y\' * 1024) for i in range(500)]"'
+
+    result = run_tool("bash", {"cmd": command})
+
+    assert len(result) <= nanocode.SPILL_THRESHOLD
+    marker = next(line for line in result.split("\n") if line.startswith("..."))
+    assert "full output (500 lines) saved to" in marker
+    assert len(open(marker.split("saved to ")[1].split(",")[0]).readlines()) == 500
+
+
+def test_bash_times_out(monkeypatch):
+    monkeypatch.setattr(nanocode, "BASH_TIMEOUT", 0.5)
+    command = f'"{sys.executable}" -c "import time; print(1, flush=True); time.sleep(30)"'
+
+    assert bash({"cmd": command}) == "1\n(timed out after 0.5s)"
+
+
+def test_output_buffer_since_reports_dropped_lines():
+    buffer = OutputBuffer("test", head=2, tail=3)
+    buffer.feed("".join(f"{idx}\n" for idx in range(10)))
+
+    assert buffer.since(0) == (["0", "1"], 5, ["7", "8", "9"])
+    assert buffer.since(1) == (["1"], 5, ["7", "8", "9"])
+    assert buffer.since(8) == ([], 0, ["8", "9"])
+    assert buffer.since(10) == ([], 0, [])
+
+
+def wait_for_job(job_id):
+    job = nanocode.JOBS[job_id]
+    deadline = time.monotonic() + 10
+    while job.finished is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_background_job_output_is_incremental():
+    command = f'"{sys.executable}" -c "print(1); print(2)"'
+    started = bash({"cmd": command, "background": True})
+    job_id = int(re.search(r"started job (\d+)", started).group(1))
+    wait_for_job(job_id)
+
+    assert "exited with code 0" in job_status({"id": job_id})
+    assert job_output({"id": job_id}) == "1\n2"
+    assert job_output({"id": job_id}).startswith("(no new output; job exited")
+    assert f"{job_id}: {command}" in job_status({})
+
+
+def test_background_job_kill():
+    command = f'"{sys.executable}" -c "import time; time.sleep(30)"'
+    job_id = int(re.search(r"started job (\d+)", bash({"cmd": command, "background": True})).group(1))
+
+    assert "running" in job_status({"id": job_id})
+    assert job_kill({"id": job_id}) == f"{job_id}: killed"
+    assert "exited" in wait_for_job(job_id).status()
+    assert run_tool("job_output", {"id": 10_000}) == "error: no job 10000"
+    assert job_kill({"id": job_id}).startswith(f"{job_id}: already exited with code")
+
+
+def test_jobs_are_scoped_to_their_session():
+    command = f'"{sys.executable}" -c "import time; time.sleep(30)"'
+    try:
+        nanocode.TURN.turn = nanocode.Turn("session-a")
+        job_id = int(re.search(r"started job (\d+)", bash({"cmd": command, "background": True})).group(1))
+        job = nanocode.JOBS[job_id]
+        nanocode.TURN.turn = nanocode.Turn("session-b")
+        assert run_tool("job_kill", {"id": job_id}) == f"error: no job {job_id}"
+        assert job_status({}) == "no jobs"
+    finally:
+        nanocode.TURN.turn = None
+
+    nanocode.kill_jobs("session-a")
+
+    assert job_id not in nanocode.JOBS
+    assert job.proc.wait(5) is not None
+
+
+def test_read_cache_sees_writes_and_edits(tmp_path):
+    source = tmp_path / "cached.txt"
+    run_tool("write", {"path": str(source), "content": "one\n"})
+    assert read({"path": str(source)}) == "   1| one\n"
+
+    run_tool("edit", {"path": str(source), "old": "one", "new": "two"})
+
+    assert read({"path": str(source)}) == "   1| two\n"
@@ -0,0 +1,74 @@
+import http.server
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import nanocode
+from nanocode import Session, run_turn
+
+
+def openai_provider(url):
+    return {"name": "fake", "kind": "openai", "api_url": url, "model": "m", "headers": {}, "extra": {}}
+
+
+def run_and_cancel(session, user_input, delay=0.3):
+    events = []
+    worker = threading.Thread(target=run_turn, args=(session, user_input, events.append))
+    worker.start()
+    time.sleep(delay)
+    session.cancel()
+    worker.join(5)
+    assert not worker.is_alive()
+    return events
+
+
+def test_cancel_running_tool_keeps_history_valid(monkeypatch):
+    monkeypatch.setattr(nanocode, "RENDER_OUTPUT", False)
+    command = f'"{sys.executable}" -c "import time; time.sleep(30)"'
+    response = {
+        "content": [
+            {"type": "tool_use", "id": "a", "name": "bash", "input": {"cmd": command}},
+            {"type": "tool_use", "id": "b", "name": "read", "input": {"path": "x"}},
+        ]
+    }
+    monkeypatch.setattr(nanocode, "call_api", lambda *args: response)
+    session = Session(openai_provider("http://unused"))
+
+    started = time.monotonic()
+    events = run_and_cancel(session, "go")
+
+    assert time.monotonic() - started < 5
+    assert events[-1] == {"type": "cancelled"}
+    assert [message["role"] for message in session.messages] == ["user", "assistant", "user", "assistant"]
+    assert session.messages[2]["content"] == [
+        {"type": "tool_result", "tool_use_id": "a", "content": "(cancelled by user)"},
+        {"type": "tool_result", "tool_use_id": "b", "content": "(cancelled by user)"},
+    ]
+    assert session.messages[3]["content"][0]["text"] == "(interrupted by user)"
+
+
+class SlowModel(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        time.sleep(10)
+
+
+def test_cancel_inflight_api_call():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowModel)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    session = Session(openai_provider(f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"))
+
+    started = time.monotonic()
+    events = run_and_cancel(session, "hello")
+
+    assert time.monotonic() - started < 5
+    assert events == [{"type": "cancelled"}]
+    assert [message["role"] for message in session.messages] == ["user", "assistant"]
+    assert session.turn is None
+    server.shutdown()